@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from extensions.images import schedule_derivatives, delete_derivatives
+from .models import Post
+
+
+@receiver(post_save, sender=Post)
+def resize_post_image(sender, instance, **kwargs):
+    name = instance.image.name
+    transaction.on_commit(lambda: schedule_derivatives(name))
+
+
+@receiver(post_delete, sender=Post)
+def delete_post_image_variants(sender, instance, **kwargs):
+    if instance.image:
+        delete_derivatives(instance.image)
@@ -1,44 +1,96 @@
 from decimal import Decimal
 from django.conf import settings
 from shop.models import Product
+from django.contrib import messages
 from django.shortcuts import redirect
 from django.utils import timesince
+from .storage import get_cart_storage
+
+class CartLine(object):
+    """
+    A cart line as shown on a page, built from the stored line and its
+    product without touching the stored data.
+    """
+    __slots__ = ('product', 'quantity', 'price', 'price_after_discount')
+
+    def __init__(self, product, quantity, price, price_after_discount):
+        self.product = product
+        self.quantity = quantity
+        self.price = price
+        self.price_after_discount = price_after_discount
+
+    @property
+    def total_price(self):
+        return self.price * self.quantity
+
+    @property
+    def total_price_after_discount(self):
+        return self.price_after_discount * self.quantity
+
+
 
 class Cart(object):
 
     def __init__(self, request):
         """
-        Initialize the cart.
+        Initialize the cart from the storage named by ``CART_STORAGE``.
         """
-        self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # save an empty cart in the session
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        self.storage = get_cart_storage(request)
+        self.cart = self.storage.load()
+        self._lines = None
 
 
-    def __iter__(self):
+    def get_lines(self):
         """
-        Iterate over the items in the cart and get the products
-        from the database.
+        Return the lines of the cart with their products, fetched in a
+        single query the first time they are needed. Lines of products
+        that no longer exist are left out.
         """
-        product_ids = self.cart.keys()
-        # get the product objects and add them to the cart
-        products = Product.objects.filter(id__in=product_ids)
+        if self._lines is None:
+            products = Product.objects.with_effective_price().in_bulk([int(product_id) for product_id in self.cart])
+            self._lines = [
+                CartLine(products[int(product_id)], item['quantity'], int(item['price']), int(item['price_after_discount']))
+                for product_id, item in self.cart.items() if int(product_id) in products
+            ]
+        return self._lines
 
 
-        cart = self.cart.copy()
-        
-        for product in products:
-            cart[str(product.id)]['product'] = product
+    def __iter__(self):
+        return iter(self.get_lines())
 
 
-        for item in self.cart.values():
-            item['price'] = int(item['price'])
-            item['price_after_discount'] = int(item['price_after_discount'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+    def revalidate(self):
+        """
+        Bring every line in step with the current price and availability of
+        its product, from the products already fetched for the lines.
+
+        Returns ``(changed, removed)``: ``(product, old price, new price)``
+        for every repriced line and the products dropped from the cart
+        because they are no longer available. Lines of deleted products
+        are dropped silently.
+        """
+        lines = self.get_lines()
+        current = {str(line.product.id) for line in lines}
+        removed = []
+        for product_id in [product_id for product_id in self.cart if product_id not in current]:
+            del self.cart[product_id]
+            self.storage.delete_line(product_id)
+
+        changed = []
+        for line in list(lines):
+            product = line.product
+            product_id = str(product.id)
+            if not product.available:
+                lines.remove(line)
+                del self.cart[product_id]
+                self.storage.delete_line(product_id)
+                removed.append(product)
+            elif (line.price, line.price_after_discount) != (product.price, product.effective_price):
+                changed.append((product, line.price_after_discount, product.effective_price))
+                line.price, line.price_after_discount = product.price, product.effective_price
+                self.cart[product_id].update(price=line.price, price_after_discount=line.price_after_discount)
+                self.storage.save_line(product_id, self.cart[product_id])
+        return changed, removed
 
 
     def __len__(self):
@@ -50,26 +102,22 @@ class Cart(object):
 
     def add(self, product, quantity=1, override_quantity=False):
         """
-        Add a product to the cart or update its quantity.
+        Add a product to the cart or update its quantity. The product must
+        carry the ``effective_price`` annotation, which stays right while
+        the stored discounted price waits for the repricer.
         """
         product_id = str(product.id)
         if product_id not in self.cart:
             self.cart[product_id] = {'quantity': 0,
-                                     'price': str(product.price), 
-                                     'price_after_discount': str(product.price_after_discount)}
+                                     'price': product.price, 
+                                     'price_after_discount': product.effective_price}
 
         if override_quantity:
             self.cart[product_id]['quantity'] = quantity
         else:
             self.cart[product_id]['quantity'] += quantity
-        self.save()
-
-
-    def save(self):
-        # Update the session cart
-        self.session[settings.CART_SESSION_ID] = self.cart
-        # mark the session as "modified" to make sure it gets saved
-        self.session.modified = True
+        self._lines = None
+        self.storage.save_line(product_id, self.cart[product_id])
 
 
     def remove(self, product):
@@ -79,25 +127,26 @@ class Cart(object):
         product_id = str(product.id)
         if product_id in self.cart:
             del self.cart[product_id]
-            self.save()
+            self._lines = None
+            self.storage.delete_line(product_id)
 
 
     def decrement(self, product):
-        for key in self.cart:
-            if key == str(product.id):
-                self.cart[str(product.id)]['quantity'] -= 1
-                if self.cart[str(product.id)]['quantity'] < 1:
-                    return redirect('cart:cart_detail')
-                self.save()
-                break
-            else:
-                print("Something Wrong")
+        product_id = str(product.id)
+        if product_id not in self.cart:
+            return
+        if self.cart[product_id]['quantity'] <= 1:
+            return redirect('cart:cart_detail')
+        self.cart[product_id]['quantity'] -= 1
+        self._lines = None
+        self.storage.save_line(product_id, self.cart[product_id])
 
 
     def clear(self):
-        # remove cart from session
-        self.session[settings.CART_SESSION_ID] = {}
-        self.session.modified = True
+        # remove every line from the storage
+        self.storage.clear()
+        self.cart = {}
+        self._lines = None
 
 
     def get_total_price(self):
@@ -109,4 +158,29 @@ class Cart(object):
 
 
     def get_discount_price(self):
-        return self.get_total_price() - self.get_total_price_after_discount()
\ No newline at end of file
+        return self.get_total_price() - self.get_total_price_after_discount()
+
+
+
+def get_cart(request):
+    """
+    The cart of this request, shared by the views and the templates so
+    its products are only fetched once.
+    """
+    if not hasattr(request, '_cart'):
+        request._cart = Cart(request)
+    return request._cart
+
+
+
+def revalidate_cart(request):
+    """
+    Revalidate the cart of this request and tell the user what changed.
+    Returns True when anything did.
+    """
+    changed, removed = get_cart(request).revalidate()
+    for product, old, new in changed:
+        messages.warning(request, f'قیمت «{product.title}» از {old:,} به {new:,} تومان تغییر کرد.')
+    for product in removed:
+        messages.warning(request, f'«{product.title}» دیگر موجود نیست و از سبد خرید حذف شد.')
+    return bool(changed or removed)
@@ -1,5 +1,7 @@
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart
 
 
 def cart(request):
-	return {'cart': Cart(request)}
\ No newline at end of file
+	# only loaded when a template actually shows the cart
+	return {'cart': SimpleLazyObject(lambda: get_cart(request))}
@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from account.models import User
+from shop.models import Product
+from cart.cart import Cart
+
+
+STORAGES = (
+    'cart.storage.SessionCartStorage',
+    'cart.storage.DatabaseCartStorage',
+    'cart.storage.CacheCartStorage',
+)
+BENCHMARK_EMAIL = 'cart-benchmark-{}@example.invalid'
+
+
+class Command(BaseCommand):
+    help = ('Measure add-to-cart throughput of the cart storages with concurrent users. '
+            'Temporary users are created and removed again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--storage', action='append', dest='storages',
+                            help='Dotted path of a storage to measure; may be repeated. Defaults to all of them.')
+        parser.add_argument('--users', type=int, default=8, help='Concurrent users, one thread each.')
+        parser.add_argument('--adds', type=int, default=100, help='Add to cart requests per user.')
+        parser.add_argument('--products', type=int, default=20, help='Distinct products to add.')
+
+    def handle(self, *args, **options):
+        products = list(Product.objects_available.with_effective_price().order_by('id')[:options['products']])
+        if not products:
+            raise CommandError('There are no available products to add.')
+        users = [User.objects.create_user(email=BENCHMARK_EMAIL.format(i)) for i in range(options['users'])]
+        try:
+            for storage in options['storages'] or STORAGES:
+                with override_settings(CART_STORAGE=storage):
+                    elapsed = self.run(users, products, options['adds'])
+                rate = len(users) * options['adds'] / elapsed
+                self.stdout.write(f'{storage}: {rate:.0f} adds/s ({elapsed:.2f}s)')
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def run(self, users, products, adds):
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        requests = []
+        for user in users:
+            request = RequestFactory().post('/')
+            request.user = user
+            request.session = session_store()
+            requests.append(request)
+
+        def shop(request):
+            try:
+                for i in range(adds):
+                    # a fresh cart per request, saved the way SessionMiddleware would
+                    Cart(request).add(products[i % len(products)])
+                    if request.session.modified:
+                        request.session.save()
+                        request.session.modified = False
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+            list(pool.map(shop, requests))
+        elapsed = time.perf_counter() - start
+
+        for request in requests:
+            Cart(request).clear()
+            request.session.delete()
+        return elapsed
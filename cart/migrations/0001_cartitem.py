@@ -0,0 +1,38 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shop', '0016_fill_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='تعداد')),
+                ('price', models.PositiveIntegerField(verbose_name='قیمت')),
+                ('price_after_discount', models.PositiveIntegerField(verbose_name='قیمت بعد از تخفیف')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='تاریخ بروزرسانی')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product', verbose_name='محصول')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'قلم سبد خرید',
+                'verbose_name_plural': 'اقلام سبد خرید',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_cart_item'),
+        ),
+    ]
@@ -1,3 +1,24 @@
 from django.db import models
+from account.models import User
+from shop.models import Product
 
-# Create your models here.
+
+class CartItem(models.Model):
+    """
+    A cart line of a signed in user, used by
+    ``cart.storage.DatabaseCartStorage``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items', verbose_name="کاربر")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="محصول")
+    quantity = models.PositiveIntegerField(default=1, verbose_name="تعداد")
+    price = models.PositiveIntegerField(verbose_name="قیمت")
+    price_after_discount = models.PositiveIntegerField(verbose_name="قیمت بعد از تخفیف")
+    updated = models.DateTimeField(auto_now=True, verbose_name="تاریخ بروزرسانی")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_item')]
+        verbose_name = "قلم سبد خرید"
+        verbose_name_plural = "اقلام سبد خرید"
+
+    def __str__(self):
+        return f'{self.user} - {self.product}'
@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from .models import CartItem
+
+
+# seconds an untouched cart is kept by the cache storage
+CART_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+CART_CACHE_KEY = 'cart:{owner}'
+
+
+class BaseCartStorage(object):
+    """
+    Where a cart keeps its lines between requests.
+
+    A line is a dict with ``quantity``, ``price`` and
+    ``price_after_discount``, keyed by the product id as a string.
+    Storages write one line at a time, so a backend that can update a
+    single row never has to rewrite the whole cart.
+    """
+    # storages keyed by the signed in user hand anonymous carts to the session
+    requires_user = False
+
+    def __init__(self, request):
+        self.request = request
+
+    def load(self):
+        raise NotImplementedError
+
+    def save_line(self, product_id, line):
+        raise NotImplementedError
+
+    def delete_line(self, product_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class SessionCartStorage(BaseCartStorage):
+    """
+    Keeps the cart in the session, as the shop always did.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.session = request.session
+
+    def load(self):
+        # an empty cart is not written to the session until a line is added
+        return self.session.get(settings.CART_SESSION_ID) or {}
+
+    def save(self):
+        # mark the session as "modified" to make sure it gets saved
+        self.session.modified = True
+
+    def save_line(self, product_id, line):
+        self.session.setdefault(settings.CART_SESSION_ID, {})[product_id] = line
+        self.save()
+
+    def delete_line(self, product_id):
+        self.session.get(settings.CART_SESSION_ID, {}).pop(product_id, None)
+        self.save()
+
+    def clear(self):
+        self.session[settings.CART_SESSION_ID] = {}
+        self.save()
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """
+    Keeps the cart of a signed in user in ``CartItem`` rows, so it
+    follows them across devices. Every change touches a single row.
+    """
+    requires_user = True
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.items = CartItem.objects.filter(user=request.user)
+
+    def load(self):
+        return {
+            str(product_id): {'quantity': quantity, 'price': price, 'price_after_discount': price_after_discount}
+            for product_id, quantity, price, price_after_discount
+            in self.items.values_list('product_id', 'quantity', 'price', 'price_after_discount')
+        }
+
+    def save_line(self, product_id, line):
+        # a single INSERT ... ON CONFLICT DO UPDATE
+        CartItem.objects.bulk_create(
+            [CartItem(user=self.request.user, product_id=int(product_id), quantity=line['quantity'],
+                      price=int(line['price']), price_after_discount=int(line['price_after_discount']))],
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['quantity', 'price', 'price_after_discount', 'updated'],
+        )
+
+    def delete_line(self, product_id):
+        self.items.filter(product_id=int(product_id)).delete()
+
+    def clear(self):
+        self.items.delete()
+
+
+class CacheCartStorage(BaseCartStorage):
+    """
+    Keeps the cart in the cache, away from the session row, keyed by the
+    user or by the session of an anonymous visitor.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.cart = None
+
+    def get_key(self, create=False):
+        if self.request.user.is_authenticated:
+            return CART_CACHE_KEY.format(owner=f'user:{self.request.user.pk}')
+        session = self.request.session
+        if session.session_key is None:
+            if not create:
+                return None
+            session.save()
+        return CART_CACHE_KEY.format(owner=f'session:{session.session_key}')
+
+    def load(self):
+        if self.cart is None:
+            key = self.get_key()
+            self.cart = cache.get(key, {}) if key else {}
+        return self.cart
+
+    def save(self):
+        cache.set(self.get_key(create=True), self.cart, CART_CACHE_TIMEOUT)
+
+    def save_line(self, product_id, line):
+        self.load()[product_id] = line
+        self.save()
+
+    def delete_line(self, product_id):
+        self.load().pop(product_id, None)
+        self.save()
+
+    def clear(self):
+        self.cart = {}
+        key = self.get_key()
+        if key:
+            cache.delete(key)
+
+
+def get_cart_storage(request):
+    """
+    The storage named by the ``CART_STORAGE`` setting, for this request.
+    """
+    storage_class = import_string(settings.CART_STORAGE)
+    if storage_class.requires_user and not request.user.is_authenticated:
+        storage_class = SessionCartStorage
+    return storage_class(request)
@@ -5,4 +5,13 @@ register = template.Library()
 
 @register.filter()
 def multiply(value, arg):
-    return float(value) * arg
\ No newline at end of file
+    return float(value) * arg
+
+
+@register.filter()
+def quantity_of(cart, product):
+    """
+    How many of ``product`` the cart holds, without loading its lines.
+    """
+    line = cart.cart.get(str(product.id))
+    return line['quantity'] if line else 0
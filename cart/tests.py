@@ -0,0 +1,291 @@
+from importlib import import_module
+from io import StringIO
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from account.models import User
+from shop.models import Category, Product
+from order.models import Address, Order
+from .cart import Cart, get_cart
+from .context_processor import cart as cart_context
+from .models import CartItem
+from .storage import SessionCartStorage, DatabaseCartStorage, CacheCartStorage, get_cart_storage
+
+
+STORAGES = (
+    'cart.storage.SessionCartStorage',
+    'cart.storage.DatabaseCartStorage',
+    'cart.storage.CacheCartStorage',
+)
+
+
+def create_product(category, slug, price=1000, discount=0):
+    product = Product.objects.create(
+        title=slug, english_name=slug, category=category, slug=slug, brand='Brand', guarantee=1,
+        price=price, discount=discount, discount_time=timezone.now() + timezone.timedelta(days=1), delivery=1
+    )
+    return Product.objects.with_effective_price().get(pk=product.pk)
+
+
+class CartStorageTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', password='testpass')
+        category = Category.objects.create(title='Phones', slug='phones')
+        self.phone = create_product(category, 'phone', price=1000, discount=10)
+        self.case = create_product(category, 'case', price=200)
+        self.session = import_module(settings.SESSION_ENGINE).SessionStore()
+
+    def make_request(self, user=None):
+        request = RequestFactory().get('/')
+        request.user = user or self.user
+        request.session = self.session
+        return request
+
+    def test_every_storage_keeps_the_cart_between_requests(self):
+        for storage in STORAGES:
+            with self.subTest(storage=storage), override_settings(CART_STORAGE=storage):
+                cart = Cart(self.make_request())
+                cart.add(self.phone)
+                cart.add(self.phone)
+                cart.add(self.case, quantity=3)
+
+                cart = Cart(self.make_request())
+                self.assertEqual(len(cart), 5)
+                self.assertEqual(cart.get_total_price(), 2600)
+                self.assertEqual(cart.get_total_price_after_discount(), 2400)
+                cart.decrement(self.phone)
+                cart.remove(self.case)
+
+                cart = Cart(self.make_request())
+                self.assertEqual([(line.product, line.quantity) for line in cart], [(self.phone, 1)])
+                cart.clear()
+                self.assertEqual(len(Cart(self.make_request())), 0)
+
+    def test_anonymous_database_carts_live_in_the_session(self):
+        with override_settings(CART_STORAGE='cart.storage.DatabaseCartStorage'):
+            self.assertIsInstance(get_cart_storage(self.make_request(AnonymousUser())), SessionCartStorage)
+            self.assertIsInstance(get_cart_storage(self.make_request()), DatabaseCartStorage)
+
+    def test_database_storage_writes_one_line_per_change(self):
+        with override_settings(CART_STORAGE='cart.storage.DatabaseCartStorage'):
+            Cart(self.make_request()).add(self.case)
+            cart = Cart(self.make_request())
+            with self.assertNumQueries(1):
+                cart.add(self.phone)
+            with self.assertNumQueries(1):
+                cart.add(self.phone)
+        self.assertEqual(sorted(CartItem.objects.values_list('product__slug', 'quantity', 'price_after_discount')),
+                         [('case', 1, 200), ('phone', 2, 900)])
+        self.assertNotIn(settings.CART_SESSION_ID, self.session)
+
+    def test_cache_storage_leaves_the_session_alone(self):
+        with override_settings(CART_STORAGE='cart.storage.CacheCartStorage'):
+            storage = get_cart_storage(self.make_request(AnonymousUser()))
+            self.assertIsInstance(storage, CacheCartStorage)
+            self.assertEqual(storage.load(), {})
+            self.assertIsNone(self.session.session_key)
+
+            Cart(self.make_request(AnonymousUser())).add(self.case)
+            self.assertEqual(len(Cart(self.make_request(AnonymousUser()))), 1)
+        self.assertNotIn(settings.CART_SESSION_ID, self.session)
+
+    def test_lines_are_built_once_without_touching_the_session(self):
+        request = self.make_request()
+        cart = get_cart(request)
+        cart.add(self.phone, quantity=2)
+        cart.add(self.case)
+        self.assertIs(get_cart(request), cart)
+        with self.assertNumQueries(1):
+            lines = list(cart)
+            self.assertEqual(list(cart), lines)
+        self.assertEqual([(line.product, line.total_price, line.total_price_after_discount) for line in lines],
+                         [(self.phone, 2000, 1800), (self.case, 200, 200)])
+        self.assertEqual(self.session[settings.CART_SESSION_ID], {
+            str(self.phone.id): {'quantity': 2, 'price': 1000, 'price_after_discount': 900},
+            str(self.case.id): {'quantity': 1, 'price': 200, 'price_after_discount': 200},
+        })
+        cart.remove(self.case)
+        self.assertEqual([line.product for line in cart], [self.phone])
+
+    def test_cart_page_fetches_products_once(self):
+        self.client.login(email='buyer@example.com', password='testpass')
+        for product in (self.phone, self.case):
+            self.client.get(reverse('cart:item_add', args=[product.id]))
+        with self.assertNumQueries(5):
+            # session, bought together, navigation, cart products and user
+            response = self.client.get(reverse('cart:cart_detail'))
+        self.assertContains(response, self.case.title)
+
+    def test_context_processor_loads_the_cart_lazily(self):
+        request = self.make_request(AnonymousUser())
+        context = cart_context(request)
+        self.assertFalse(hasattr(request, '_cart'))
+        self.assertEqual(len(context['cart']), 0)
+        self.assertIs(request._cart, context['cart']._wrapped)
+        self.assertNotIn(settings.CART_SESSION_ID, self.session)
+        self.assertFalse(self.session.modified)
+
+    def test_anonymous_pages_do_not_start_a_session(self):
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    @override_settings(CART_STORAGE='cart.storage.DatabaseCartStorage')
+    def test_database_cart_follows_the_user_across_sessions(self):
+        self.client.login(email='buyer@example.com', password='testpass')
+        self.client.get(reverse('cart:item_add', args=[self.phone.id]))
+        self.client.logout()
+
+        self.client.login(email='buyer@example.com', password='testpass')
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(len(response.context['cart']), 1)
+
+
+class CartRevalidationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', password='testpass')
+        category = Category.objects.create(title='Phones', slug='phones')
+        self.phone = create_product(category, 'phone', price=1000, discount=10)
+        self.case = create_product(category, 'case', price=200)
+        self.charger = create_product(category, 'charger', price=300)
+        self.client.login(email='buyer@example.com', password='testpass')
+        for product in (self.phone, self.case, self.charger):
+            self.client.get(reverse('cart:item_add', args=[product.id]))
+
+    def cart_lines(self):
+        return {int(product_id): (line['price'], line['price_after_discount'])
+                for product_id, line in self.client.session[settings.CART_SESSION_ID].items()}
+
+    def test_cart_page_refreshes_prices_and_drops_unavailable_products(self):
+        # the discount ended without the stored price being recomputed yet
+        Product.objects.filter(pk=self.phone.pk).update(discount_time=timezone.now() - timezone.timedelta(days=1),
+                                                       price_after_discount=900)
+        Product.objects.filter(pk=self.case.pk).update(available=False)
+        with self.assertNumQueries(8):
+            # session, the cart products, bought together, navigation, user
+            # and three statements saving the revalidated session
+            response = self.client.get(reverse('cart:cart_detail'))
+        messages = [str(message) for message in response.context['messages']]
+        self.assertEqual(messages, ['قیمت «phone» از 900 به 1,000 تومان تغییر کرد.',
+                                    '«case» دیگر موجود نیست و از سبد خرید حذف شد.'])
+        self.assertEqual(self.cart_lines(), {self.phone.pk: (1000, 1000), self.charger.pk: (300, 300)})
+        self.assertEqual(response.context['cart'].get_total_price_after_discount(), 1300)
+
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(list(response.context['messages']), [])
+
+    def test_products_are_added_at_their_effective_price(self):
+        # the discount ended but the repricer has not run yet
+        ended = create_product(Category.objects.get(), 'ended', price=500, discount=20)
+        Product.objects.filter(pk=ended.pk).update(discount_time=timezone.now() - timezone.timedelta(hours=1),
+                                                   price_after_discount=400)
+        self.client.get(reverse('cart:item_add', args=[ended.id]))
+        self.assertEqual(self.cart_lines()[ended.pk], (500, 500))
+        data = self.client.post(reverse('cart:item_update', args=[ended.id, 'add'])).json()
+        self.assertEqual(data['line']['total_price_after_discount'], 1000)
+
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(list(response.context['messages']), [])
+
+    def test_unavailable_products_cannot_be_added(self):
+        Product.objects.filter(pk=self.case.pk).update(available=False)
+        self.assertEqual(self.client.get(reverse('cart:item_add', args=[self.case.id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('cart:item_increment', args=[self.case.id])).status_code, 404)
+        self.assertEqual(self.client.post(reverse('cart:item_update', args=[self.case.id, 'add'])).status_code, 404)
+        self.assertEqual(self.client.session[settings.CART_SESSION_ID][str(self.case.pk)]['quantity'], 1)
+
+    def test_checkout_sends_a_changed_cart_back_for_review(self):
+        Address.objects.create(title='Tehran', user=self.user)
+        session = self.client.session
+        session.update({'payment_type': 'Online', 'description': ''})
+        session.save()
+        Product.objects.filter(pk=self.charger.pk).update(price=350)
+        response = self.client.get(reverse('order:order_create'))
+        self.assertRedirects(response, reverse('cart:cart_detail'))
+        self.assertFalse(Order.objects.exists())
+
+        response = self.client.get(reverse('order:order_create'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(Order.objects.get().items.values_list('product__slug', 'price_after_discount')),
+                         [('case', 200), ('charger', 350), ('phone', 900)])
+
+
+class CartApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', password='testpass')
+        category = Category.objects.create(title='Phones', slug='phones')
+        self.phone = create_product(category, 'phone', price=1000, discount=10)
+        self.case = create_product(category, 'case', price=200)
+        self.client.login(email='buyer@example.com', password='testpass')
+
+    def update(self, product, action):
+        return self.client.post(reverse('cart:item_update', args=[product.id, action]))
+
+    def test_changes_return_the_line_and_totals(self):
+        self.update(self.case, 'add')
+        response = self.update(self.phone, 'add')
+        self.assertEqual(response.json(), {
+            'product': self.phone.id,
+            'line': {'quantity': 1, 'total_price': 1000, 'total_price_after_discount': 900},
+            'count': 2, 'total_price': 1200, 'total_price_after_discount': 1100, 'discount_price': 100,
+        })
+        self.assertEqual(self.update(self.phone, 'add').json()['line']['quantity'], 2)
+        self.assertEqual(self.update(self.phone, 'decrement').json()['line']['quantity'], 1)
+        # the last one takes the line with it
+        data = self.update(self.phone, 'decrement').json()
+        self.assertIsNone(data['line'])
+        self.assertEqual((data['count'], data['total_price_after_discount']), (1, 200))
+
+        data = self.update(self.case, 'remove').json()
+        self.assertIsNone(data['line'])
+        self.assertEqual((data['count'], data['total_price_after_discount']), (0, 0))
+
+    def test_a_change_skips_the_page_render(self):
+        self.update(self.phone, 'add')
+        with self.assertNumQueries(6):
+            # session, user, product and three statements saving the session
+            self.update(self.phone, 'add')
+
+    def test_requests_are_checked(self):
+        self.assertEqual(self.client.get(reverse('cart:item_update', args=[self.phone.id, 'add'])).status_code, 405)
+        self.assertEqual(self.update(self.phone, 'empty').status_code, 404)
+        Product.objects.filter(pk=self.case.pk).update(available=False)
+        self.assertEqual(self.update(self.case, 'add').status_code, 404)
+
+        self.client.logout()
+        response = self.update(self.phone, 'add')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'login_url': reverse('login')})
+
+    def test_pages_show_the_quantity_hooks(self):
+        self.update(self.phone, 'add')
+        self.update(self.phone, 'add')
+        response = self.client.get(self.phone.get_absolute_url())
+        self.assertContains(response, f'value="2" data-cart-quantity="{self.phone.id}"', html=False)
+        self.assertContains(response, reverse('cart:item_update', args=[self.phone.id, 'decrement']))
+        response = self.client.get(self.case.get_absolute_url())
+        self.assertContains(response, f'value="0" data-cart-quantity="{self.case.id}"', html=False)
+
+    def test_cart_page_shows_the_line_total_hook(self):
+        self.update(self.phone, 'add')
+        self.update(self.phone, 'add')
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertContains(response, f'<span data-cart-line-total="{self.phone.id}">2,000</span>', html=False)
+        self.assertEqual(self.update(self.phone, 'add').json()['line']['total_price'], 3000)
+
+
+class CartBenchmarkTestCase(TransactionTestCase):
+    def test_benchmark_reports_every_storage_and_cleans_up(self):
+        category = Category.objects.create(title='Phones', slug='phones')
+        create_product(category, 'phone')
+        out = StringIO()
+        call_command('benchmark_cart', users=4, adds=5, stdout=out)
+        for storage in STORAGES:
+            self.assertIn(f'{storage}: ', out.getvalue())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
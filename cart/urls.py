@@ -10,4 +10,5 @@ urlpatterns = [
     path('item_decrement/<int:id>/', views.item_decrement, name='item_decrement'),
     path('cart_clear/', views.cart_clear, name='cart_clear'),
     path('cart_detail/',views.cart_detail,name='cart_detail'),
+    path('items/<int:id>/<slug:action>/', views.item_update, name='item_update'),
 ]   
\ No newline at end of file
@@ -1,14 +1,17 @@
-from django.shortcuts import render, redirect, HttpResponse
+from django.conf import settings
+from django.http import JsonResponse, Http404
+from django.shortcuts import render, redirect, resolve_url, get_object_or_404, HttpResponse
+from django.views.decorators.http import require_POST
 from shop.models import Product
 from django.contrib.auth.decorators import login_required
-from .cart import Cart
+from .cart import get_cart, revalidate_cart
+from order.recommendations import bought_together_with_cart
 
 
 @login_required
 def item_add(request, id):
-    cart = Cart(request)
-    product = Product.objects.get(id=id)
-    product.get_discount()
+    cart = get_cart(request)
+    product = get_object_or_404(Product.objects_available.with_effective_price(), id=id)
     cart.add(product=product)
     if request.GET.get('next') is None:
         return redirect('shop:home')
@@ -17,7 +20,7 @@ def item_add(request, id):
 
 @login_required
 def item_clear(request, id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = Product.objects.get(id=id)
     cart.remove(product)
     return redirect("cart:cart_detail")
@@ -25,15 +28,15 @@ def item_clear(request, id):
 
 @login_required
 def item_increment(request, id):
-    cart = Cart(request)
-    product = Product.objects.get(id=id)
+    cart = get_cart(request)
+    product = get_object_or_404(Product.objects_available.with_effective_price(), id=id)
     cart.add(product=product)
     return redirect(product.get_absolute_url())
 
 
 @login_required
 def item_decrement(request, id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = Product.objects.get(id=id)
     cart.decrement(product=product)
     return redirect(product.get_absolute_url())
@@ -41,11 +44,63 @@ def item_decrement(request, id):
 
 @login_required
 def cart_clear(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     cart.clear()
     return redirect("cart:cart_detail")
 
 
 def cart_detail(request):
-    cart = Cart(request)
-    return render(request, 'cart/cart_detail.html')
\ No newline at end of file
+    cart = get_cart(request)
+    revalidate_cart(request)
+    product_ids = [int(product_id) for product_id in cart.cart]
+    return render(request, 'cart/cart_detail.html', {'bought_together': bought_together_with_cart(product_ids)})
+
+
+def cart_state(cart, product_id):
+    """
+    The totals of the cart and one of its lines, read from the stored
+    lines without loading any product.
+    """
+    line = cart.cart.get(str(product_id))
+    if line is not None:
+        price, price_after_discount = int(line['price']), int(line['price_after_discount'])
+        line = {
+            'quantity': line['quantity'],
+            'total_price': price * line['quantity'],
+            'total_price_after_discount': price_after_discount * line['quantity'],
+        }
+    return {
+        'product': product_id,
+        'line': line,
+        'count': len(cart),
+        'total_price': cart.get_total_price(),
+        'total_price_after_discount': cart.get_total_price_after_discount(),
+        'discount_price': cart.get_discount_price(),
+    }
+
+
+@require_POST
+def item_update(request, id, action):
+    """
+    Add, decrement or remove a product and return the changed line with
+    the new totals, so the page is updated in place. Decrementing the last
+    one removes the line.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'login_url': resolve_url(settings.LOGIN_URL)}, status=401)
+    cart = get_cart(request)
+    if action == 'add':
+        cart.add(product=get_object_or_404(Product.objects_available.with_effective_price(), id=id))
+    elif action == 'decrement':
+        product = get_object_or_404(Product.objects.only('id'), id=id)
+        line = cart.cart.get(str(id))
+        # the last one takes the line with it, as item_clear does
+        if line is not None and line['quantity'] <= 1:
+            cart.remove(product)
+        else:
+            cart.decrement(product=product)
+    elif action == 'remove':
+        cart.remove(get_object_or_404(Product.objects.only('id'), id=id))
+    else:
+        raise Http404
+    return JsonResponse(cart_state(cart, id))
@@ -104,6 +104,9 @@ if DEBUG:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # a file rather than memory, so tests running several threads
+            # (benchmark_cart) get sqlite's locking with a busy timeout
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -169,6 +172,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 CART_SESSION_ID = 'cart'
+# where carts are kept: cart.storage.SessionCartStorage, DatabaseCartStorage or CacheCartStorage
+CART_STORAGE = 'cart.storage.SessionCartStorage'
+
+# seconds cached catalog blocks (home page lists and fragments) are kept
+SHOP_CACHE_TIMEOUT = 60 * 15
+
+# processes resizing uploaded images, None for one per CPU
+IMAGE_PROCESS_WORKERS = None
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4' 
 
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image, ImageOps
+
+
+# widths of the generated variants, in pixels; originals are never upscaled
+IMAGE_WIDTHS = (320, 640, 1024)
+# every width is saved as webp for browsers that take it and as jpeg for the rest
+IMAGE_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+IMAGE_QUALITY = 80
+DERIVATIVE_RE = re.compile(r'\.\d+w\.(webp|jpg)$')
+IMAGE_WIDTHS_KEY = 'images:widths:{digest}'
+# how long an image without variants is trusted to have none, while they
+# may still be generated
+MISSING_WIDTHS_TIMEOUT = 60 * 5
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def derivative_name(name, width, extension):
+    """
+    The storage name of a variant, next to the original:
+    ``products/phone.png`` -> ``products/phone.320w.webp``.
+    """
+    return f'{os.path.splitext(name)[0]}.{width}w.{extension}'
+
+
+def is_derivative(name):
+    return bool(DERIVATIVE_RE.search(name))
+
+
+def generate_derivatives(path):
+    """
+    Write the resized variants of the image file at ``path`` and return
+    their paths. Runs in a worker process, so it only touches the file
+    system. Missing, unreadable or oversized files produce no variants.
+    """
+    created = []
+    try:
+        with Image.open(path) as original:
+            original = ImageOps.exif_transpose(original)
+            for width in IMAGE_WIDTHS:
+                if width >= original.width:
+                    break
+                height = round(original.height * width / original.width)
+                resized = original.resize((width, height), Image.LANCZOS)
+                for extension, image_format in IMAGE_FORMATS:
+                    target = derivative_name(path, width, extension)
+                    variant = resized.convert('RGB') if image_format == 'JPEG' else resized
+                    variant.save(target, image_format, quality=IMAGE_QUALITY)
+                    created.append(target)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # one bad upload must not stop a backfill of all the others
+        pass
+    return created
+
+
+def widths_key(name):
+    return IMAGE_WIDTHS_KEY.format(digest=hashlib.md5(name.encode()).hexdigest())
+
+
+def created_widths(path, created):
+    return [width for width in IMAGE_WIDTHS if derivative_name(path, width, 'webp') in created]
+
+
+def record_widths(name, widths):
+    """
+    Remember which variants of the stored file ``name`` exist, so pages
+    can list them without asking the storage.
+    """
+    cache.set(widths_key(name), widths, None if widths else MISSING_WIDTHS_TIMEOUT)
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+        return _pool
+
+
+def schedule_derivatives(name):
+    """
+    Generate the variants of an uploaded file in the shared process pool,
+    without holding up the request, and return the pending future. Uploads
+    get unique names, so a file that already has variants is skipped.
+    """
+    if not name or is_derivative(name):
+        return
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    if os.path.exists(derivative_name(path, IMAGE_WIDTHS[0], 'webp')):
+        return
+
+    def done(future):
+        if not future.exception():
+            record_widths(name, created_widths(path, future.result()))
+
+    future = get_pool().submit(generate_derivatives, path)
+    future.add_done_callback(done)
+    return future
+
+
+def delete_derivatives(field):
+    for width in IMAGE_WIDTHS:
+        for extension, image_format in IMAGE_FORMATS:
+            field.storage.delete(derivative_name(field.name, width, extension))
+    cache.delete(widths_key(field.name))
+
+
+def find_originals(root):
+    for directory, dirnames, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if not is_derivative(filename):
+                yield os.path.join(directory, filename)
+
+
+def backfill_derivatives(root, workers=None):
+    """
+    Generate the variants of every original under ``root`` in parallel.
+    Returns the number of files written.
+    """
+    originals = list(find_originals(root))
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, created in zip(originals, pool.map(generate_derivatives, originals, chunksize=16)):
+            record_widths(os.path.relpath(path, settings.MEDIA_ROOT), created_widths(path, created))
+            written += len(created)
+    return written
+
+
+def available_widths(field):
+    """
+    The variant widths that exist for an image field, smallest first, as
+    recorded when they were generated. The storage is only asked when
+    nothing is recorded, for files that predate the record or whose entry
+    was evicted, and the answer is recorded in turn.
+    """
+    widths = cache.get(widths_key(field.name))
+    if widths is None:
+        storage = field.storage
+        widths = [width for width in IMAGE_WIDTHS if storage.exists(derivative_name(field.name, width, 'webp'))]
+        record_widths(field.name, widths)
+    return widths
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class OrderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'order'
-    verbose_name = "سفارشات"
\ No newline at end of file
+    verbose_name = "سفارشات"
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,109 @@
+import datetime
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import Order, OrderItem, DailyProductSales
+
+
+BEST_SELLER_WINDOWS = (7, 30)
+SALES_VERSION_KEY = 'order:sales:version'
+BEST_SELLERS_KEY = 'order:best_sellers:{days}:{limit}:{today}:{version}'
+
+
+def get_sales_version():
+    version = cache.get(SALES_VERSION_KEY)
+    if version is None:
+        cache.add(SALES_VERSION_KEY, int(time.time()), None)
+        version = cache.get(SALES_VERSION_KEY, int(time.time()))
+    return version
+
+
+def bump_sales_version():
+    try:
+        cache.incr(SALES_VERSION_KEY)
+    except ValueError:
+        cache.add(SALES_VERSION_KEY, int(time.time()), None)
+
+
+def add_daily_sales(product_id, day, quantity):
+    updated = DailyProductSales.objects.filter(product_id=product_id, day=day).update(quantity=F('quantity') + quantity)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DailyProductSales.objects.create(product_id=product_id, day=day, quantity=quantity)
+    except IntegrityError:
+        # another order created the bucket first
+        DailyProductSales.objects.filter(product_id=product_id, day=day).update(quantity=F('quantity') + quantity)
+
+
+@transaction.atomic
+def record_order_sales(order):
+    """
+    Add the items of a paid order to the daily sales buckets, once.
+
+    Returns False when the order is not paid, has no items yet or has
+    already been counted.
+    """
+    if not order.check_paid():
+        return False
+    items = list(order.items.values('product').annotate(quantity=Sum('quantity')).values_list('product', 'quantity'))
+    if not items:
+        return False
+    # the flag is flipped in the database so a concurrent save cannot count it twice
+    if not Order.objects.filter(pk=order.pk, sales_recorded=False).update(sales_recorded=True):
+        return False
+    order.sales_recorded = True
+    # orders paid on delivery have no paid time; rebuild_daily_sales
+    # falls back to the creation date as well
+    day = timezone.localdate(order.paid_time or order.created)
+    for product_id, quantity in items:
+        add_daily_sales(product_id, day, quantity)
+    transaction.on_commit(bump_sales_version)
+    return True
+
+
+def best_seller_ids(days, limit):
+    """
+    Return the ids of the available products sold most over the last
+    ``days`` days, best first.
+
+    Only the buckets of the window are summed, through the covering index
+    on ``(day, product, quantity)``, and the result is cached until the
+    next recorded sale or the next day.
+    """
+    today = timezone.localdate()
+    key = BEST_SELLERS_KEY.format(days=days, limit=limit, today=today.isoformat(), version=get_sales_version())
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(DailyProductSales.objects.filter(day__gt=today - datetime.timedelta(days=days),
+                                                    product__available=True)
+                   .values('product').annotate(sold=Sum('quantity'))
+                   .order_by('-sold', 'product').values_list('product', flat=True)[:limit])
+        cache.set(key, ids, settings.SHOP_CACHE_TIMEOUT)
+    return ids
+
+
+@transaction.atomic
+def rebuild_daily_sales(days=max(BEST_SELLER_WINDOWS)):
+    """
+    Recompute the buckets of the last ``days`` days from the items of
+    paid orders and drop older ones. Returns the number of buckets.
+    """
+    since = timezone.localdate() - datetime.timedelta(days=days - 1)
+    paid_day = TruncDate(Coalesce('order__paid_time', 'order__created'), tzinfo=timezone.get_current_timezone())
+    buckets = (OrderItem.objects.filter(order__in=Order.paid.all())
+               .annotate(day=paid_day).filter(day__gte=since)
+               .values('product', 'day').annotate(sold=Sum('quantity')).order_by())
+    DailyProductSales.objects.all().delete()
+    DailyProductSales.objects.bulk_create(
+        [DailyProductSales(product_id=row['product'], day=row['day'], quantity=row['sold']) for row in buckets],
+        batch_size=1000,
+    )
+    Order.paid.filter(sales_recorded=False).update(sales_recorded=True)
+    transaction.on_commit(bump_sales_version)
+    return DailyProductSales.objects.count()
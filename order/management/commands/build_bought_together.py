@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from order.recommendations import (build_bought_together, ORDERS_PER_CHUNK, BOUGHT_TOGETHER_TOP_K,
+                                   BOUGHT_TOGETHER_MIN_COUNT)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "frequently bought together" products from paid orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=ORDERS_PER_CHUNK, help='Orders read per query.')
+        parser.add_argument('--top-k', type=int, default=BOUGHT_TOGETHER_TOP_K)
+        parser.add_argument('--min-count', type=int, default=BOUGHT_TOGETHER_MIN_COUNT,
+                            help='Orders a pair must share to be stored.')
+
+    def handle(self, *args, **options):
+        count = build_bought_together(options['chunk_size'], options['top_k'], options['min_count'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {count} associations.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from order.best_sellers import rebuild_daily_sales, BEST_SELLER_WINDOWS
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales buckets behind the best-seller rankings from paid orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=max(BEST_SELLER_WINDOWS),
+                            help='Days of history to keep; older buckets are dropped.')
+
+    def handle(self, *args, **options):
+        count = rebuild_daily_sales(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily sales buckets.'))
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_similarproduct'),
+        ('order', '0002_alter_order_shipping_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FrequentlyBoughtTogether',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(verbose_name='تعداد سفارش های مشترک')),
+                ('confidence', models.FloatField(verbose_name='نسبت به سفارش های محصول')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bought_with', to='shop.product', verbose_name='محصول همراه')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bought_together', to='shop.product', verbose_name='محصول مربوطه')),
+            ],
+            options={
+                'verbose_name': 'محصول خریداری شده همراه',
+                'verbose_name_plural': 'محصولات خریداری شده همراه',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='frequentlyboughttogether',
+            index=models.Index(fields=['product', '-count'], name='order_frequ_product_dad239_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='frequentlyboughttogether',
+            unique_together={('product', 'other')},
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_similarproduct'),
+        ('order', '0003_frequentlyboughttogether'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='sales_recorded',
+            field=models.BooleanField(default=False, editable=False, verbose_name='در پرفروش ها ثبت شده؟'),
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='روز')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='تعداد فروخته شده')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.product', verbose_name='محصول مربوطه')),
+            ],
+            options={
+                'verbose_name': 'فروش روزانه',
+                'verbose_name_plural': 'فروش های روزانه',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailyproductsales',
+            index=models.Index(fields=['day', 'product', 'quantity'], name='order_daily_day_77887f_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyproductsales',
+            unique_together={('product', 'day')},
+        ),
+    ]
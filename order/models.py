@@ -22,6 +22,13 @@ class Address(models.Model):
 
 
 
+class PaidManager(models.Manager):
+    def get_queryset(self):
+        return super(PaidManager, self).get_queryset().filter(
+            models.Q(is_paid=True) | models.Q(shipping_status__in=Order.PAID_STATUSES))
+
+
+
 class Order(models.Model):
     STATUS = (
         ('Waiting Payment', 'در انتظار پرداخت'),
@@ -32,6 +39,8 @@ class Order(models.Model):
         ('Canceled', 'لغو شده'), 
         ('Waiting For Checking', 'منتظر تایید شدن چک')
     )
+    # orders in these states have been paid for, whatever is_paid says
+    PAID_STATUSES = ('Paid', 'Posted', 'Delivered')
 
     PAYMENT_TYPE = (
         ('Internet', 'پرداخت اینترنتی'), 
@@ -49,6 +58,10 @@ class Order(models.Model):
     payment_type = models.CharField(choices=PAYMENT_TYPE, default='Internet', max_length=100, verbose_name="نوع پرداخت")
     ref_id = models.IntegerField(blank=True, null=True, verbose_name="کد رهگیری پرداخت اینترنتی")
     description = models.TextField(verbose_name="توضیحات مربوط به سفارش(رنگ کالا)")
+    sales_recorded = models.BooleanField(default=False, editable=False, verbose_name="در پرفروش ها ثبت شده؟")
+
+    objects = models.Manager()
+    paid = PaidManager()
     
 
     class Meta:
@@ -121,6 +134,10 @@ class Order(models.Model):
     show_paid.boolean = True
     show_paid.short_description = "وضعیت پرداخت"
 
+
+    def check_paid(self):
+        return self.is_paid or self.shipping_status in self.PAID_STATUSES
+
    
 
 class OrderItem(models.Model):
@@ -149,6 +166,42 @@ class OrderItem(models.Model):
 
 
 
+class DailyProductSales(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales', verbose_name="محصول مربوطه")
+    day = models.DateField(verbose_name="روز")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="تعداد فروخته شده")
+
+    class Meta:
+        unique_together = ('product', 'day',)
+        # covers the per window sums without touching the table rows
+        indexes = [models.Index(fields=['day', 'product', 'quantity'])]
+        verbose_name = "فروش روزانه"
+        verbose_name_plural = "فروش های روزانه"
+
+    def __str__(self):
+        return f'{self.product} - {self.day}: {self.quantity}'
+
+
+
+
+class FrequentlyBoughtTogether(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_together', verbose_name="محصول مربوطه")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_with', verbose_name="محصول همراه")
+    count = models.PositiveIntegerField(verbose_name="تعداد سفارش های مشترک")
+    confidence = models.FloatField(verbose_name="نسبت به سفارش های محصول")
+
+    class Meta:
+        unique_together = ('product', 'other',)
+        indexes = [models.Index(fields=['product', '-count'])]
+        verbose_name = "محصول خریداری شده همراه"
+        verbose_name_plural = "محصولات خریداری شده همراه"
+
+    def __str__(self):
+        return f'{self.product} + {self.other}'
+
+
+
+
 class CheckImage(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE, verbose_name="سفارش مربوطه")
     check_image = models.ImageField(upload_to='check/check_image/', verbose_name="عکس چک") 
@@ -0,0 +1,121 @@
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum, Max, Min
+from shop.models import Product
+from .models import Order, OrderItem, FrequentlyBoughtTogether
+
+
+ORDERS_PER_CHUNK = 50000
+BOUGHT_TOGETHER_TOP_K = 10
+BOUGHT_TOGETHER_MIN_COUNT = 2
+BOUGHT_TOGETHER_LIMIT = 6
+
+
+def order_pairs(order_ids, product_ids):
+    """
+    Return every ordered ``(product, other)`` pair bought in the same
+    order, given the items of some orders as two arrays sorted by order.
+    """
+    starts = np.flatnonzero(np.r_[True, order_ids[1:] != order_ids[:-1]])
+    sizes = np.diff(np.r_[starts, len(order_ids)])
+    # each item is paired with every item of its own order
+    repeats = np.repeat(sizes, sizes)
+    first = np.repeat(np.arange(len(order_ids)), repeats)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    second = np.repeat(np.repeat(starts, sizes), repeats) + offsets
+    keep = first != second
+    return product_ids[first[keep]], product_ids[second[keep]]
+
+
+def merge_counts(keys, counts):
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def count_pairs(orders_per_chunk=ORDERS_PER_CHUNK):
+    """
+    Count how many paid orders contain each product and each pair of
+    products.
+
+    Items are read one range of order ids at a time, so an order is never
+    split between chunks. Each chunk keeps only its distinct pairs and the
+    chunks are merged once at the end. Returns ``(width, pair_keys, pair_counts, orders)``
+    where a pair key is ``product * width + other`` and ``orders`` is a
+    per product id array.
+    """
+    bounds = Order.paid.aggregate(low=Min('id'), high=Max('id'))
+    width = (Product.objects.aggregate(high=Max('id'))['high'] or 0) + 1
+    orders = np.zeros(width, dtype=np.int64)
+    chunk_keys, chunk_counts = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    if bounds['low'] is None:
+        return width, chunk_keys[0], chunk_counts[0], orders
+
+    for start in range(bounds['low'], bounds['high'] + 1, orders_per_chunk):
+        paid = Order.paid.filter(id__gte=start, id__lt=start + orders_per_chunk)
+        rows = np.array(list(OrderItem.objects.filter(order__in=paid).values_list('order_id', 'product_id')),
+                        dtype=np.int64).reshape(-1, 2)
+        if not len(rows):
+            continue
+        # a product listed twice in one order still counts once, and
+        # products added since the build started are left for the next one
+        rows = np.unique(rows[rows[:, 1] < width], axis=0)
+        orders += np.bincount(rows[:, 1], minlength=width)
+        first, second = order_pairs(rows[:, 0], rows[:, 1])
+        keys, counts = np.unique(first * width + second, return_counts=True)
+        chunk_keys.append(keys)
+        chunk_counts.append(counts)
+    keys, counts = merge_counts(np.concatenate(chunk_keys), np.concatenate(chunk_counts))
+    return width, keys, counts, orders
+
+
+def top_pairs(width, keys, counts, orders, top_k=BOUGHT_TOGETHER_TOP_K, min_count=BOUGHT_TOGETHER_MIN_COUNT):
+    """
+    Yield ``(product, other, count, confidence)`` for the ``top_k`` most
+    frequent companions of every product.
+    """
+    keep = counts >= min_count
+    keys, counts = keys[keep], counts[keep]
+    products, others = keys // width, keys % width
+    order = np.lexsort((others, -counts, products))
+    products, others, counts = products[order], others[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]]) if len(products) else np.empty(0, dtype=np.int64)
+    rank = np.arange(len(products)) - np.repeat(starts, np.diff(np.r_[starts, len(products)]))
+    for product, other, count in zip(products[rank < top_k], others[rank < top_k], counts[rank < top_k]):
+        yield int(product), int(other), int(count), float(count / orders[product])
+
+
+def build_bought_together(orders_per_chunk=ORDERS_PER_CHUNK, top_k=BOUGHT_TOGETHER_TOP_K,
+                          min_count=BOUGHT_TOGETHER_MIN_COUNT):
+    """
+    Rebuild the stored "frequently bought together" associations from
+    every paid order. Returns the number of associations stored.
+    """
+    pairs = [
+        FrequentlyBoughtTogether(product_id=product, other_id=other, count=count, confidence=confidence)
+        for product, other, count, confidence in top_pairs(*count_pairs(orders_per_chunk), top_k, min_count)
+    ]
+    # only the swap is atomic, the long read above holds no transaction
+    with transaction.atomic():
+        FrequentlyBoughtTogether.objects.all().delete()
+        FrequentlyBoughtTogether.objects.bulk_create(pairs, batch_size=1000)
+    return len(pairs)
+
+
+def bought_together(product, limit=BOUGHT_TOGETHER_LIMIT):
+    """
+    Available products most often bought with ``product``.
+    """
+    return list(Product.objects_available.filter(bought_with__product=product)
+                .order_by('-bought_with__count', '-id')[:limit])
+
+
+def bought_together_with_cart(product_ids, limit=BOUGHT_TOGETHER_LIMIT):
+    """
+    Available products most often bought with any of the cart's products.
+    """
+    if not product_ids:
+        return []
+    return list(Product.objects_available.filter(bought_with__product__in=product_ids)
+                .exclude(pk__in=product_ids)
+                .annotate(together=Sum('bought_with__count'))
+                .order_by('-together', '-id')[:limit])
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Order
+from .best_sellers import record_order_sales
+
+
+@receiver(post_save, sender=Order)
+def record_paid_order(sender, instance, **kwargs):
+    if not instance.sales_recorded and instance.check_paid():
+        record_order_sales(instance)
@@ -0,0 +1,154 @@
+from io import StringIO
+import numpy as np
+from django.test import TestCase
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.timezone import timedelta
+from django.core.cache import cache
+from account.models import User
+from shop.models import Category, Product
+from .models import Address, Order, OrderItem, FrequentlyBoughtTogether, DailyProductSales
+from .recommendations import order_pairs, build_bought_together, bought_together_with_cart
+from .best_sellers import record_order_sales, best_seller_ids, rebuild_daily_sales
+
+
+class BoughtTogetherTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='buyer@example.com', password='testpass')
+        self.address = Address.objects.create(title='Tehran', user=self.user)
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        self.phone, self.case, self.charger, self.cable = [
+            Product.objects.create(
+                title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand', guarantee=1,
+                price=100, discount=0, discount_time=timezone.now(), delivery=1
+            ) for slug in ('phone', 'case', 'charger', 'cable')
+        ]
+
+    def create_order(self, *products, **kwargs):
+        kwargs.setdefault('is_paid', True)
+        order = Order.objects.create(user=self.user, address=self.address, **kwargs)
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, price=100, price_after_discount=100)
+        return order
+
+    def associations(self, product):
+        return list(FrequentlyBoughtTogether.objects.filter(product=product).order_by('-count', 'other_id')
+                    .values_list('other__slug', 'count'))
+
+    def test_order_pairs(self):
+        first, second = order_pairs(np.array([1, 1, 1, 2, 2]), np.array([10, 11, 12, 10, 13]))
+        self.assertEqual(sorted(zip(first.tolist(), second.tolist())), [
+            (10, 11), (10, 12), (10, 13), (11, 10), (11, 12), (12, 10), (12, 11), (13, 10),
+        ])
+
+    def test_counts_paid_orders_only(self):
+        self.create_order(self.phone, self.case)
+        self.create_order(self.phone, self.case, self.charger, is_paid=False, shipping_status='Posted')
+        self.create_order(self.phone, self.charger)
+        self.create_order(self.phone, self.cable, is_paid=False)
+        build_bought_together(min_count=1)
+        self.assertEqual(self.associations(self.phone), [('case', 2), ('charger', 2)])
+        self.assertEqual(self.associations(self.cable), [])
+        self.assertEqual(FrequentlyBoughtTogether.objects.get(product=self.case, other=self.phone).confidence, 1)
+
+    def test_chunks_give_the_same_result(self):
+        for i in range(5):
+            self.create_order(self.phone, self.case, self.case if i % 2 else self.charger)
+        build_bought_together(min_count=1)
+        expected = self.associations(self.phone)
+        build_bought_together(orders_per_chunk=2, min_count=1)
+        self.assertEqual(self.associations(self.phone), expected)
+        self.assertEqual(expected, [('case', 5), ('charger', 3)])
+
+    def test_top_k_and_min_count(self):
+        self.create_order(self.phone, self.case, self.charger)
+        self.create_order(self.phone, self.case)
+        build_bought_together(top_k=1, min_count=1)
+        self.assertEqual(self.associations(self.phone), [('case', 2)])
+        build_bought_together(min_count=2)
+        self.assertEqual(self.associations(self.charger), [])
+
+    def test_shown_on_product_and_cart_pages(self):
+        self.create_order(self.phone, self.case, self.charger)
+        self.create_order(self.phone, self.case)
+        call_command('build_bought_together', '--min-count', '1', stdout=StringIO())
+        response = self.client.get(self.phone.get_absolute_url())
+        self.assertEqual(response.context['bought_together'], [self.case, self.charger])
+        self.assertEqual(bought_together_with_cart([self.phone.id, self.case.id]), [self.charger])
+        self.client.force_login(self.user)
+        self.client.get(reverse('cart:item_add', args=[self.case.id]))
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(response.context['bought_together'], [self.phone, self.charger])
+
+
+class BestSellersTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', password='testpass')
+        self.address = Address.objects.create(title='Tehran', user=self.user)
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        self.old, self.new, self.other = [
+            Product.objects.create(
+                title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand', guarantee=1,
+                price=100, discount=0, discount_time=timezone.now(), delivery=1, number_sold=number_sold
+            ) for slug, number_sold in (('old', 1000), ('new', 0), ('other', 0))
+        ]
+
+    def sell(self, product, quantity, **kwargs):
+        order = Order.objects.create(user=self.user, address=self.address, **kwargs)
+        OrderItem.objects.create(order=order, product=product, price=100, price_after_discount=100, quantity=quantity)
+        return order
+
+    def pay(self, order, days_ago=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            order.is_paid = True
+            order.paid_time = timezone.now() - timedelta(days=days_ago)
+            order.save()
+
+    def test_paying_an_order_records_it_once(self):
+        order = self.sell(self.new, 3)
+        self.assertFalse(DailyProductSales.objects.exists())
+        self.pay(order)
+        self.pay(order)
+        self.assertEqual(DailyProductSales.objects.get(product=self.new).quantity, 3)
+        self.assertFalse(record_order_sales(order))
+
+    def test_windows(self):
+        self.pay(self.sell(self.new, 2))
+        self.pay(self.sell(self.other, 5), days_ago=10)
+        self.pay(self.sell(self.old, 9), days_ago=40)
+        self.assertEqual(best_seller_ids(7, 10), [self.new.id])
+        self.assertEqual(best_seller_ids(30, 10), [self.other.id, self.new.id])
+        self.pay(self.sell(self.new, 4))
+        self.assertEqual(best_seller_ids(30, 10), [self.new.id, self.other.id])
+
+    def test_cash_on_delivery_order_is_recorded_with_its_items(self):
+        order = Order.objects.create(user=self.user, address=self.address, shipping_status='Posted')
+        OrderItem.objects.create(order=order, product=self.new, price=100, price_after_discount=100, quantity=2)
+        self.assertTrue(record_order_sales(order))
+        self.assertEqual(DailyProductSales.objects.get(product=self.new).quantity, 2)
+
+    def test_orders_without_paid_time_count_on_their_creation_day(self):
+        order = Order.objects.create(user=self.user, address=self.address, shipping_status='Posted')
+        Order.objects.filter(pk=order.pk).update(created=timezone.now() - timedelta(days=3))
+        order.refresh_from_db()
+        OrderItem.objects.create(order=order, product=self.new, price=100, price_after_discount=100, quantity=2)
+        self.assertTrue(record_order_sales(order))
+        recorded = list(DailyProductSales.objects.values_list('product', 'day', 'quantity'))
+        self.assertEqual(recorded, [(self.new.id, timezone.localdate(order.created), 2)])
+        rebuild_daily_sales()
+        self.assertEqual(list(DailyProductSales.objects.values_list('product', 'day', 'quantity')), recorded)
+
+    def test_home_prefers_recent_sales(self):
+        self.pay(self.sell(self.new, 1))
+        response = self.client.get(reverse('shop:home'))
+        self.assertEqual([p.slug for p in response.context['best_sellers_products']], ['new', 'old', 'other'])
+
+    def test_rebuild_command(self):
+        self.pay(self.sell(self.new, 2))
+        self.pay(self.sell(self.new, 1))
+        self.pay(self.sell(self.other, 7), days_ago=45)
+        DailyProductSales.objects.update(quantity=0)
+        call_command('rebuild_best_sellers', stdout=StringIO())
+        self.assertEqual(list(DailyProductSales.objects.values_list('product', 'quantity')), [(self.new.id, 3)])
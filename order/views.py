@@ -2,8 +2,9 @@ from decimal import Decimal
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
-from cart.cart import Cart
+from cart.cart import get_cart, revalidate_cart
 from .models import OrderItem, Order, Address
+from .best_sellers import record_order_sales
 import uuid
 from django.utils import timezone
 from .forms import PaymentTypeForm, CheckForm
@@ -42,7 +43,10 @@ def order_process(request):
 
 @login_required
 def order_create(request):
-    cart = Cart(request)
+    cart = get_cart(request)
+    # the order is placed at the prices shown, so a changed cart goes back for review
+    if revalidate_cart(request):
+        return redirect('cart:cart_detail')
     address = None
     order = None
 
@@ -75,10 +79,10 @@ def order_create(request):
 
     for item in cart:
         OrderItem.objects.create(order=order,
-                                    product=item['product'],
-                                    price=item['price'],
-                                    price_after_discount=item['price_after_discount'], 
-                                    quantity=item['quantity'])
+                                    product=item.product,
+                                    price=item.price,
+                                    price_after_discount=item.price_after_discount, 
+                                    quantity=item.quantity)
         
 
     for item in order.items.all():
@@ -86,6 +90,9 @@ def order_create(request):
         item.product.save()
         item.save()
 
+    # cash on delivery orders are posted, and so paid, before their items exist
+    record_order_sales(order)
+
     cart.clear()
     request.session['order_id'] = order.id
     request.session.modified = True
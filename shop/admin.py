@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Product, Category, Image, Property, Description, TechnicalDescription, Contact, Banner, Comment
+from django.contrib import admin, messages
+from django.db import transaction
+from .models import Product, Category, Image, Property, Description, TechnicalDescription, Contact, Banner, Comment, WaitingComment
+from .comments import refresh_comment_stats
 
 admin.site.site_header = 'فروشگاه همتا'
 
@@ -32,8 +34,15 @@ class TechnicalDescriptionInline(admin.TabularInline):
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_filter = ('category', 'brand', 'available', 'created', 'updated', 'discount', 'discount_time', 'delivery')
+    search_fields = ('title', 'english_name', 'slug')
     inlines = [PropertyInline, ImageInline, DescriptionInline, TechnicalDescriptionInline, CommentInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # recomputing neighbours reads the whole catalog, so it is left to
+        # build_similar_products --stale rather than done in the request
+        Product.objects.filter(pk=form.instance.pk).update(similar_stale=True)
+
 
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
@@ -42,10 +51,46 @@ class ContactAdmin(admin.ModelAdmin):
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_filter = ('product', 'user', 'created_on', 'status', 'offer_vote')
+    list_display = ('title', 'product', 'user', 'status', 'offer_vote', 'created_on')
+    # products and users are looked up by search and autocomplete, never
+    # listed whole in the sidebar or a select box
+    list_filter = ('status', 'offer_vote', 'created_on')
+    search_fields = ('title', 'product__title', 'user__phone_number', 'user__email')
+    autocomplete_fields = ('product', 'user')
+    list_select_related = ('product', 'user')
+    show_full_result_count = False
+    actions = ['accept_comments', 'reject_comments']
+
+    def moderate(self, request, queryset, status):
+        with transaction.atomic():
+            product_ids = set(queryset.values_list('product', flat=True))
+            updated = queryset.update(status=status)
+            refresh_comment_stats(product_ids)
+        self.message_user(request, f'{updated} نظر بروزرسانی شد.', messages.SUCCESS)
+
+    @admin.action(description="تایید نظرات انتخاب شده")
+    def accept_comments(self, request, queryset):
+        self.moderate(request, queryset, 'accepted')
+
+    @admin.action(description="رد نظرات انتخاب شده")
+    def reject_comments(self, request, queryset):
+        self.moderate(request, queryset, 'not accepted')
+
+
+
+@admin.register(WaitingComment)
+class WaitingCommentAdmin(CommentAdmin):
+    list_display = ('title', 'description', 'product', 'user', 'offer_vote', 'created_on')
+    list_filter = ('offer_vote', 'created_on')
+    list_per_page = 50
+
 
 
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('full_title', 'slug')
+    search_fields = ('title', 'slug')
+    ordering = ('path', )
 
-admin.site.register(Category)
 
 admin.site.register(Banner)
@@ -5,3 +5,6 @@ class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
     verbose_name = "فروشگاه"
+
+    def ready(self):
+        from . import signals
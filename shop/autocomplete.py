@@ -0,0 +1,83 @@
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+from django.urls import reverse
+from .caching import get_products_version
+from .models import Product
+from .search import tokenize
+
+
+SUGGESTION_LIMIT = 8
+# prefixes up to this length match too many entries to rank per lookup,
+# their suggestions are ranked once when the index is built
+SHORT_PREFIX = 2
+
+_index = None
+_lock = threading.Lock()
+
+
+class PrefixIndex(object):
+    """
+    A sorted array of every word suffix of product titles, english names
+    and brands, answering prefix lookups with ``bisect``.
+
+    Products are numbered by popularity, so the smallest matching numbers
+    are the best suggestions.
+    """
+
+    def __init__(self, products, version=None):
+        self.version = version
+        self.suggestions = []
+        self.short = {}
+        entries = []
+        for rank, product in enumerate(products):
+            self.suggestions.append({
+                'title': product['title'],
+                'english_name': product['english_name'],
+                'brand': product['brand'],
+                'url': reverse('shop:product_detail', kwargs={'id': product['id'], 'slug': product['slug']}),
+            })
+            for field in ('title', 'english_name', 'brand'):
+                tokens = tokenize(product[field])
+                for start in range(len(tokens)):
+                    key = ' '.join(tokens[start:])
+                    entries.append((key, rank))
+                    # products come in rank order, so the first ones seen are the best
+                    for length in range(1, SHORT_PREFIX + 1):
+                        ranks = self.short.setdefault(key[:length], [])
+                        if len(ranks) < SUGGESTION_LIMIT and rank not in ranks:
+                            ranks.append(rank)
+        entries.sort()
+        self.keys = [key for key, rank in entries]
+        self.ranks = [rank for key, rank in entries]
+
+    def lookup(self, prefix, limit=SUGGESTION_LIMIT):
+        prefix = ' '.join(tokenize(prefix))
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX and limit <= SUGGESTION_LIMIT:
+            found = self.short.get(prefix, [])[:limit]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_right(self.keys, prefix + '\uffff', start)
+            found = heapq.nsmallest(limit, set(self.ranks[start:end]))
+        return [self.suggestions[rank] for rank in found]
+
+
+def get_prefix_index():
+    """
+    Return this process's prefix index, rebuilding it when a product has
+    been saved or deleted. Lookups on a current index never hit the
+    database.
+    """
+    global _index
+    version = get_products_version()
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                products = (Product.objects_available.order_by('-number_sold', '-id')
+                            .values('id', 'slug', 'title', 'english_name', 'brand'))
+                _index = PrefixIndex(products, version)
+            index = _index
+    return index
@@ -0,0 +1,199 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from .models import Product, Category
+from .pagination import PRODUCT_ORDERINGS, ordering_key
+from order.best_sellers import best_seller_ids
+
+
+CATALOG_VERSION_KEY = 'shop:catalog:version'
+PRODUCTS_VERSION_KEY = 'shop:products:version'
+HOME_PRODUCTS_KEY = 'shop:home:products:{version}'
+NAVIGATION_KEY = 'shop:navigation'
+ACTIVE_OFFERS_KEY = 'shop:offers:{version}'
+HOME_OFFERS_LIMIT = 10
+HOME_BEST_SELLERS_DAYS = 30
+HOME_BEST_SELLERS_LIMIT = 9
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # start from the clock so an evicted counter never reuses old keys
+        cache.add(key, int(time.time()), None)
+        version = cache.get(key, int(time.time()))
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time()), None)
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version used to namespace cached
+    product lists and rendered fragments.
+    """
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog block by moving to a new version.
+    """
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def get_products_version():
+    """
+    Return the version of the product rows themselves, which only moves
+    when a product is saved or deleted.
+    """
+    return _get_version(PRODUCTS_VERSION_KEY)
+
+
+def bump_products_version():
+    _bump_version(PRODUCTS_VERSION_KEY)
+
+
+def _next_discount_expiry(products, now):
+    expiries = [p.discount_time for p in products if p.discount and p.discount_time > now]
+    return min(expiries).timestamp() if expiries else None
+
+
+def get_active_offers():
+    """
+    Return the ids of every available product with a running discount,
+    newest first, and the timestamp at which the first of them ends.
+
+    The list is cached per catalog version and rebuilt once that discount
+    has ended, so offer pages never filter the product table themselves.
+    The rebuild is a range scan of the ``(available, discount_time)`` index.
+    ``rows`` holds the list again in every listing ordering, as the sort
+    values of each product, for ``SortedRowsPaginator``.
+    """
+    key = ACTIVE_OFFERS_KEY.format(version=get_catalog_version())
+    data = cache.get(key)
+    if data is not None and (data['valid_until'] is None or data['valid_until'] > time.time()):
+        return data
+
+    columns = {name.lstrip('-') for ordering in PRODUCT_ORDERINGS.values() for name in ordering}
+    products = list(Product.objects_available.filter(~Q(discount=0), discount_time__gt=timezone.now())
+                    .values('discount_time', *columns))
+    rows = {}
+    for name, ordering in PRODUCT_ORDERINGS.items():
+        rows[name] = sorted((tuple(product[field.lstrip('-')] for field in ordering) for product in products),
+                            key=ordering_key(ordering))
+    data = {
+        'ids': [row[-1] for row in rows['newest']],
+        'rows': rows,
+        'valid_until': min(p['discount_time'] for p in products).timestamp() if products else None,
+    }
+    cache.set(key, data, settings.SHOP_CACHE_TIMEOUT)
+    return data
+
+
+def get_active_offer_ids():
+    return get_active_offers()['ids']
+
+
+def windowed_best_sellers(fields, limit=HOME_BEST_SELLERS_LIMIT):
+    """
+    The products sold most over the last month, topped up with the
+    lifetime best sellers while the window holds too few of them.
+    """
+    ids = best_seller_ids(HOME_BEST_SELLERS_DAYS, limit)
+    products = Product.objects_available.only(*fields).in_bulk(ids)
+    best_sellers = [products[pk] for pk in ids if pk in products]
+    if len(best_sellers) < limit:
+        best_sellers += list(Product.objects_available.only(*fields).exclude(pk__in=ids)
+                             .order_by('-number_sold', '-id')[:limit - len(best_sellers)])
+    return best_sellers
+
+
+def get_home_product_ids():
+    """
+    Return the product ids shown on the home page, cached per catalog version.
+
+    The cached entry also remembers the earliest discount expiry among the
+    listed products, after which prices and the offers block are rebuilt.
+    Returns a ``(fragment_version, ids)`` tuple; the fragment version names
+    this build of the lists, so rendered home fragments are replaced with
+    them while every other catalog cache is left alone.
+    """
+    version = get_catalog_version()
+    key = HOME_PRODUCTS_KEY.format(version=version)
+    data = cache.get(key)
+    if data is not None and (data['valid_until'] is None or data['valid_until'] > time.time()):
+        return f"{version}.{data['built']}", data
+
+    now = timezone.now()
+    fields = ('id', 'discount', 'discount_time')
+    last_products = list(Product.objects_available.only(*fields)[:20])
+    best_sellers = windowed_best_sellers(fields)
+    offers = get_active_offers()
+    expiries = [t for t in (_next_discount_expiry(last_products + best_sellers, now), offers['valid_until']) if t]
+
+    data = {
+        'last_products': [p.id for p in last_products],
+        'best_sellers_products': [p.id for p in best_sellers],
+        'offer_product': offers['ids'][:HOME_OFFERS_LIMIT],
+        'valid_until': min(expiries) if expiries else None,
+        'built': time.time_ns(),
+    }
+    cache.set(key, data, settings.SHOP_CACHE_TIMEOUT)
+    return f"{version}.{data['built']}", data
+
+
+class CategoryNode(object):
+    """
+    A category as shown in the menus, detached from the database.
+    """
+
+    def __init__(self, id, title, slug):
+        self.id = id
+        self.title = title
+        self.slug = slug
+        self.url = reverse("shop:product_list_by_category", args=[slug])
+        self.children = []
+
+    def __str__(self):
+        return self.title
+
+    def get_absolute_url(self):
+        return self.url
+
+
+class NavigationTree(object):
+    def __init__(self, rows):
+        self.nodes = [CategoryNode(pk, title, slug) for pk, title, slug, parent_id in rows]
+        by_id = {node.id: node for node in self.nodes}
+        self.roots = []
+        for node, (pk, title, slug, parent_id) in zip(self.nodes, rows):
+            if parent_id is None:
+                self.roots.append(node)
+            elif parent_id in by_id:
+                by_id[parent_id].children.append(node)
+
+
+def get_navigation_tree():
+    """
+    Return the category tree used by the menus and the footer, built
+    with one query and shared through the cache until a category changes.
+    """
+    tree = cache.get(NAVIGATION_KEY)
+    if tree is None:
+        rows = list(Category.objects.order_by('id').values_list('id', 'title', 'slug', 'parent_id'))
+        tree = NavigationTree(rows)
+        cache.set(NAVIGATION_KEY, tree, settings.SHOP_CACHE_TIMEOUT)
+    return tree
+
+
+def invalidate_navigation_tree():
+    cache.delete(NAVIGATION_KEY)
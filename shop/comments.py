@@ -0,0 +1,36 @@
+from django.db.models import Count, Q, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Product, Comment
+from .pagination import KeysetPaginator
+
+
+COMMENTS_PER_PAGE = 10
+
+
+def comment_stats(product_ref):
+    """
+    Subqueries counting the accepted and the recommending comments of
+    the product ``product_ref`` points at.
+    """
+    stats = (Comment.objects.filter(product=product_ref, status='accepted').order_by()
+             .values('product').annotate(total=Count('id'), recommend=Count('id', filter=Q(offer_vote=True))))
+    return {
+        'comment_count': Coalesce(Subquery(stats.values('total')[:1]), Value(0)),
+        'recommend_count': Coalesce(Subquery(stats.values('recommend')[:1]), Value(0)),
+    }
+
+
+def refresh_comment_stats(product_ids):
+    """
+    Recount the comment counters of the given products in one UPDATE.
+    """
+    return Product.objects.filter(pk__in=list(product_ids)).update(**comment_stats(OuterRef('pk')))
+
+
+def comment_page(product_id, cursor=None, per_page=COMMENTS_PER_PAGE):
+    """
+    One page of a product's accepted comments, newest first, read from
+    the ``(product, status, created_on)`` index.
+    """
+    comments = Comment.accepted.filter(product_id=product_id).select_related('user')
+    return KeysetPaginator(comments, ('-created_on', '-id'), per_page).page(cursor)
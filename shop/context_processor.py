@@ -1,12 +1,13 @@
-from .models import Category, Banner
+from .models import Banner
+from .caching import get_navigation_tree
 
 
 def categories(request):
-    return {'categories': Category.objects.filter(parent=None)}
+    return {'categories': get_navigation_tree().roots}
 
 
 def show_categories_in_footer(request):
-    return {'categories_footer': Category.objects.all()[0:9]}
+    return {'categories_footer': get_navigation_tree().nodes[0:9]}
 
 
 def banners(request):
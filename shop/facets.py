@@ -0,0 +1,103 @@
+from collections import Counter
+from django.db.models import Q, Case, When, Value, Count, CharField, IntegerField
+from django.utils import timezone
+
+
+# (key, label, lowest price, highest price) in toman
+PRICE_BUCKETS = (
+    ('0-5', 'تا ۵ میلیون تومان', 0, 5000000),
+    ('5-10', '۵ تا ۱۰ میلیون تومان', 5000000, 10000000),
+    ('10-20', '۱۰ تا ۲۰ میلیون تومان', 10000000, 20000000),
+    ('20-40', '۲۰ تا ۴۰ میلیون تومان', 20000000, 40000000),
+    ('40-', 'بیش از ۴۰ میلیون تومان', 40000000, None),
+)
+PRICE_LABELS = {key: label for key, label, low, high in PRICE_BUCKETS}
+
+
+def price_range_q(low, high, field='price_after_discount'):
+    q = Q(**{f'{field}__gte': low})
+    if high is not None:
+        q &= Q(**{f'{field}__lt': high})
+    return q
+
+
+class ProductFacets(object):
+    """
+    Brand, price, delivery and discount filters read from the query string,
+    with the number of matching products for every option.
+
+    All counts come from one grouped query over the unfiltered listing;
+    each facet is counted with the other facets' selections applied.
+    """
+
+    def __init__(self, params):
+        self.brands = params.getlist('brand')
+        self.prices = [key for key in params.getlist('price') if key in PRICE_LABELS]
+        self.deliveries = [int(days) for days in params.getlist('delivery') if days.isdigit()]
+        self.discount = params.get('discount') == '1'
+
+    def discount_q(self):
+        return ~Q(discount=0) & Q(discount_time__gt=timezone.now())
+
+    def filter(self, queryset):
+        if self.brands:
+            queryset = queryset.filter(brand__in=self.brands)
+        if self.prices:
+            q = Q()
+            for key, label, low, high in PRICE_BUCKETS:
+                if key in self.prices:
+                    q |= price_range_q(low, high)
+            queryset = queryset.filter(q)
+        if self.deliveries:
+            queryset = queryset.filter(delivery__in=self.deliveries)
+        if self.discount:
+            queryset = queryset.filter(self.discount_q())
+        return queryset
+
+    def _matches(self, row, skip):
+        return ((skip == 'brand' or not self.brands or row['brand'] in self.brands)
+                and (skip == 'price' or not self.prices or row['price_bucket'] in self.prices)
+                and (skip == 'delivery' or not self.deliveries or row['delivery'] in self.deliveries)
+                and (skip == 'discount' or not self.discount or row['has_discount']))
+
+    def summary(self, queryset):
+        """
+        Return the facet groups to render for ``queryset``, the listing
+        before these filters are applied.
+        """
+        price_bucket = Case(
+            *[When(price_range_q(low, high), then=Value(key)) for key, label, low, high in PRICE_BUCKETS],
+            output_field=CharField(),
+        )
+        has_discount = Case(When(self.discount_q(), then=Value(1)), default=Value(0), output_field=IntegerField())
+        rows = list(queryset.order_by()
+                    .annotate(price_bucket=price_bucket, has_discount=has_discount)
+                    .values('brand', 'delivery', 'price_bucket', 'has_discount')
+                    .annotate(count=Count('id')))
+
+        counts = {name: Counter() for name in ('brand', 'price', 'delivery', 'discount')}
+        for row in rows:
+            for name, value in (('brand', row['brand']), ('price', row['price_bucket']),
+                                ('delivery', row['delivery']), ('discount', row['has_discount'])):
+                if self._matches(row, skip=name):
+                    counts[name][value] += row['count']
+
+        return [
+            {'name': 'brand', 'label': 'برند', 'options': [
+                {'value': brand, 'label': brand, 'count': count, 'selected': brand in self.brands}
+                for brand, count in counts['brand'].most_common()
+            ]},
+            {'name': 'price', 'label': 'محدوده قیمت', 'options': [
+                {'value': key, 'label': label, 'count': counts['price'][key], 'selected': key in self.prices}
+                for key, label, low, high in PRICE_BUCKETS if counts['price'][key]
+            ]},
+            {'name': 'delivery', 'label': 'زمان تحویل', 'options': [
+                {'value': days, 'label': f'{days} روزه', 'count': counts['delivery'][days],
+                 'selected': days in self.deliveries}
+                for days in sorted(counts['delivery'])
+            ]},
+            {'name': 'discount', 'label': 'تخفیف', 'options': [
+                {'value': 1, 'label': 'فقط کالاهای تخفیف دار', 'count': counts['discount'][1],
+                 'selected': self.discount}
+            ] if counts['discount'][1] else []},
+        ]
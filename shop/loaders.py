@@ -0,0 +1,54 @@
+from .models import Product
+
+
+SIMILAR_PRODUCTS_LIMIT = 12
+
+
+def product_detail_queryset():
+    """
+    Products with every collection shown on the detail page attached, so
+    the page costs the same number of queries however large they are.
+    """
+    return Product.objects.select_related('category').prefetch_related(
+        'images',
+        'properties',
+        'descriptions',
+        'technical_descriptions',
+    )
+
+
+def similar_products(product, limit=SIMILAR_PRODUCTS_LIMIT):
+    """
+    The precomputed nearest neighbours of ``product`` that are still
+    available, most similar first.
+
+    Products the similarity engine has not reached yet fall back to other
+    products of the same category.
+    """
+    products = list(Product.objects_available.filter(similar_to__product=product)
+                    .order_by('-similar_to__score', '-id')[:limit])
+    if products:
+        return products
+    return list(Product.objects_available.filter(category_id=product.category_id)
+                .exclude(pk=product.pk)[:limit])
+
+
+def build_technical_tree(rows):
+    """
+    Assemble a product's flat technical description rows into a tree.
+
+    Every row gets a ``tree_children`` list, so templates can walk the
+    whole hierarchy without a query per node. Returns the root rows.
+    """
+    rows = sorted(rows, key=lambda row: row.id)
+    by_id = {row.id: row for row in rows}
+    roots = []
+    for row in rows:
+        row.tree_children = []
+    for row in rows:
+        parent = by_id.get(row.parent_id)
+        if parent is None:
+            roots.append(row)
+        else:
+            parent.tree_children.append(row)
+    return roots
@@ -0,0 +1,18 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from extensions.images import backfill_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized webp and jpeg variants of every image already uploaded under MEDIA_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='products', help='Directory under MEDIA_ROOT to process.')
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_PROCESS_WORKERS,
+                            help='Number of worker processes, one per CPU by default.')
+
+    def handle(self, *args, **options):
+        root = os.path.join(settings.MEDIA_ROOT, options['path'])
+        count = backfill_derivatives(root, options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} image variants.'))
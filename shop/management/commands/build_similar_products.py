@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from shop.similarity import (build_similar_products, refresh_similar_products, refresh_stale_similar_products,
+                             SIMILAR_PRODUCTS_TOP_K)
+
+
+class Command(BaseCommand):
+    help = ('Recompute the similar products shown on product pages. '
+            'Run with --stale every few minutes from cron to pick up products edited in the admin.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', dest='products',
+                            help='Only refresh around this product id; may be repeated.')
+        parser.add_argument('--stale', action='store_true', help='Only refresh around products edited since the last run.')
+        parser.add_argument('--top-k', type=int, default=SIMILAR_PRODUCTS_TOP_K)
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            affected = refresh_stale_similar_products(options['top_k'])
+            self.stdout.write(self.style.SUCCESS(f'Refreshed {len(affected)} products.'))
+        elif options['products']:
+            affected = refresh_similar_products(options['products'], options['top_k'])
+            self.stdout.write(self.style.SUCCESS(f'Refreshed {len(affected)} products.'))
+        else:
+            count = build_similar_products(options['top_k'])
+            self.stdout.write(self.style.SUCCESS(f'Computed neighbours of {count} products.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from shop.models import Product
+from shop.search import reindex_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(product_ids), batch_size):
+            reindex_products(product_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {len(product_ids)} products.'))
@@ -0,0 +1,21 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shop.pricing import reprice_products, REPRICE_BATCH_SIZE, REPRICE_LOOKBACK
+
+
+class Command(BaseCommand):
+    help = ('Recompute the discounted price of products whose discount started or ended. '
+            'Meant to run every few minutes from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=REPRICE_LOOKBACK.total_seconds() / 3600,
+                            help='How far back to look for ended discounts.')
+        parser.add_argument('--all', action='store_true', help='Check every ended discount.')
+        parser.add_argument('--batch-size', type=int, default=REPRICE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = None if options['all'] else now - datetime.timedelta(hours=options['hours'])
+        count = reprice_products(now, since, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Repriced {count} products.'))
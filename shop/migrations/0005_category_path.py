@@ -0,0 +1,50 @@
+# Generated by Django 4.1.5 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+def build_category_paths(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    categories = {category.pk: category for category in Category.objects.all()}
+
+    def build(category):
+        if category.path:
+            return category
+        if category.parent_id is None:
+            category.path, category.depth, category.full_title = f'{category.pk}/', 0, category.title
+        else:
+            parent = build(categories[category.parent_id])
+            category.path = f'{parent.path}{category.pk}/'
+            category.depth = parent.depth + 1
+            category.full_title = f'{parent.full_title} -> {category.title}'
+        return category
+
+    for category in categories.values():
+        build(category)
+    Category.objects.bulk_update(categories.values(), ['path', 'depth', 'full_title'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_alter_product_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='عمق دسته بندی'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='full_title',
+            field=models.CharField(blank=True, editable=False, max_length=1000, verbose_name='عنوان کامل دسته بندی'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='مسیر دسته بندی'),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+    ]
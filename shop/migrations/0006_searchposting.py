@@ -0,0 +1,28 @@
+# Generated by Django 4.1.5 on 2026-10-18 19:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=100, verbose_name='واژه')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='وزن')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='shop.product', verbose_name='محصول مربوطه')),
+            ],
+            options={
+                'verbose_name': 'واژه ی جستجو',
+                'verbose_name_plural': 'واژه های جستجو',
+                'unique_together': {('token', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.5 on 2026-10-18 19:55
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_vector_index(apps, schema_editor):
+    # GIN indexes only exist on PostgreSQL; other databases search the postings
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS shop_product_search_vector_gin '
+            'ON shop_product USING gin (search_vector)'
+        )
+
+
+def drop_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS shop_product_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_searchposting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_vector_index, drop_search_vector_index),
+    ]
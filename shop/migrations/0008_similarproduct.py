@@ -0,0 +1,35 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='میزان شباهت')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_links', to='shop.product', verbose_name='محصول مربوطه')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='shop.product', verbose_name='محصول مشابه')),
+            ],
+            options={
+                'verbose_name': 'محصول مشابه',
+                'verbose_name_plural': 'محصولات مشابه',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='similarproduct',
+            index=models.Index(fields=['product', '-score'], name='shop_simila_product_4e9b78_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarproduct',
+            unique_together={('product', 'similar')},
+        ),
+    ]
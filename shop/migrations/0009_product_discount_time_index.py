@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_similarproduct'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='discount_time',
+            field=models.DateTimeField(db_index=True, verbose_name='تخفیف تا تاریخ'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_discount_time_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='price_after_discount',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='قیمت بعد از تخفیف'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_price_after_discount_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'discount_time'], name='shop_produc_availab_b923d8_idx'),
+        ),
+    ]
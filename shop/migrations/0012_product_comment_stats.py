@@ -0,0 +1,27 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_product_available_discount_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='تعداد نظرات'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='recommend_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='تعداد پیشنهاد دهندگان'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', 'status', '-created_on'], name='shop_commen_product_71239c_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count, Q, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_stats(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Comment = apps.get_model('shop', 'Comment')
+    stats = (Comment.objects.filter(product=OuterRef('pk'), status='accepted').order_by()
+             .values('product').annotate(total=Count('id'), recommend=Count('id', filter=Q(offer_vote=True))))
+    Product.objects.update(
+        comment_count=Coalesce(Subquery(stats.values('total')[:1]), Value(0)),
+        recommend_count=Coalesce(Subquery(stats.values('recommend')[:1]), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_product_comment_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_comment_stats, migrations.RunPython.noop),
+    ]
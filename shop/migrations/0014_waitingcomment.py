@@ -0,0 +1,27 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:16
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_fill_product_comment_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitingComment',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'نظر در انتظار بررسی',
+                'verbose_name_plural': 'صف بررسی نظرات',
+                'ordering': ('created_on',),
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('shop.comment',),
+        ),
+    ]
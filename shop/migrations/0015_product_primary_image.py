@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_waitingcomment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/%Y/%m/%d', verbose_name='عکس اصلی'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_primary_image(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Image = apps.get_model('shop', 'Image')
+    first = Image.objects.filter(product=OuterRef('pk')).order_by('pk').values('image')[:1]
+    Product.objects.update(primary_image=Coalesce(Subquery(first), Value('')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_primary_image, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_fill_product_primary_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='similar_stale',
+            field=models.BooleanField(db_index=True, default=False, editable=False, verbose_name='نیازمند محاسبه مشابه ها'),
+        ),
+    ]
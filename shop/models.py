@@ -1,13 +1,58 @@
 from django.db import models
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
 from django.urls import reverse
 from decimal import Decimal
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from account.models import User
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.postgres.search import SearchVectorField
 from extensions.utils import jalali_converter
 
 
-class AvailableManager(models.Manager):
+def effective_price(now=None, price=models.F('price'), discount=models.F('discount'),
+                    discount_time=models.F('discount_time')):
+    """
+    The price a product sells for at ``now`` as a database expression,
+    rounded down like the stored ``price_after_discount``.
+    """
+    now = now or timezone.now()
+    return models.Case(
+        models.When(GreaterThan(discount_time, models.Value(now, output_field=models.DateTimeField())),
+                    # widened first, prices times a percentage outgrow a 32 bit integer
+                    then=Cast(price, models.BigIntegerField()) * (100 - discount) / 100),
+        default=price,
+        output_field=models.PositiveIntegerField(),
+    )
+
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_effective_price(self, now=None):
+        return self.annotate(effective_price=effective_price(now))
+
+    def update(self, **kwargs):
+        # keep the stored discounted price in step, computed from the new
+        # values in the same statement
+        if {'price', 'discount', 'discount_time'} & kwargs.keys() and 'price_after_discount' not in kwargs:
+            values = {
+                name: kwargs[name] if hasattr(kwargs[name], 'resolve_expression') else models.Value(kwargs[name])
+                for name in ('price', 'discount', 'discount_time') if name in kwargs
+            }
+            kwargs['price_after_discount'] = effective_price(**values)
+        return super().update(**kwargs)
+
+    def refresh_primary_images(self):
+        """
+        Copy the first image of each product into ``primary_image``.
+        """
+        first = Image.objects.filter(product=models.OuterRef('pk')).order_by('pk').values('image')[:1]
+        return self.update(primary_image=Coalesce(models.Subquery(first), models.Value('')))
+
+
+
+class AvailableManager(models.Manager.from_queryset(ProductQuerySet)):
     def get_queryset(self):
         return super(AvailableManager, self).get_queryset().filter(available=True)
 
@@ -23,6 +68,9 @@ class Category(models.Model):
     title = models.CharField(max_length=100, verbose_name="عنوان دسته بندی")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="اسلاگ دسته بندی")
     parent = models.ForeignKey('self', related_name='children', on_delete=models.CASCADE, blank=True, null=True, verbose_name="والد دسته بندی")
+    path = models.CharField(max_length=255, db_index=True, blank=True, editable=False, verbose_name="مسیر دسته بندی")
+    depth = models.PositiveIntegerField(default=0, editable=False, verbose_name="عمق دسته بندی")
+    full_title = models.CharField(max_length=1000, blank=True, editable=False, verbose_name="عنوان کامل دسته بندی")
 
     class Meta:
         unique_together = ('slug', 'parent',)    
@@ -31,18 +79,65 @@ class Category(models.Model):
 
 
     def __str__(self):
-        full_path = [self.title]                  
-        k = self.parent
-        while k is not None:
-            full_path.append(k.title)
-            k = k.parent
-        return ' -> '.join(full_path[::-1])  
+        return self.full_title or self.title
 
 
     def get_absolute_url(self):
         return reverse("shop:product_list_by_category", args=[self.slug])
 
 
+    def clean(self):
+        if self.path and self.parent_id and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': "دسته بندی نمی‌تواند زیرمجموعه ی خودش باشد."})
+
+
+    def get_tree_values(self):
+        """
+        Compute the materialized path, depth and full title of this node
+        from its parent.
+        """
+        if self.parent_id is None:
+            return f'{self.pk}/', 0, self.title
+        parent = self.parent
+        return f'{parent.path}{self.pk}/', parent.depth + 1, f'{parent.full_title} -> {self.title}'
+
+
+    def get_ancestors(self):
+        """
+        Return the ancestors of this node, root first, in a single query.
+        """
+        ids = [int(pk) for pk in self.path.split('/') if pk][:-1]
+        return Category.objects.filter(pk__in=ids).order_by('depth')
+
+
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        super().save(*args, **kwargs)
+        values = self.get_tree_values()
+        if values == (self.path, self.depth, self.full_title):
+            return
+        self.path, self.depth, self.full_title = values
+        Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth, full_title=self.full_title)
+        if old_path:
+            self.rebuild_descendants(old_path)
+
+
+    def rebuild_descendants(self, old_path):
+        """
+        Rewrite the path, depth and full title of every node that lived
+        under ``old_path`` after this node has moved or been renamed.
+        """
+        nodes = {self.pk: self}
+        descendants = list(Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).order_by('depth'))
+        for node in descendants:
+            parent = nodes[node.parent_id]
+            node.path = f'{parent.path}{node.pk}/'
+            node.depth = parent.depth + 1
+            node.full_title = f'{parent.full_title} -> {node.title}'
+            nodes[node.pk] = node
+        Category.objects.bulk_update(descendants, ['path', 'depth', 'full_title'])
+
+
 
 class Product(models.Model):
     title = models.CharField(max_length=100, db_index=True, verbose_name="نام محصول")
@@ -53,21 +148,31 @@ class Product(models.Model):
     guarantee = models.PositiveIntegerField(verbose_name="گارانتی محصول")
     available = models.BooleanField(default=True, verbose_name="موجود است؟")
     price = models.PositiveIntegerField(verbose_name="قیمت")
-    price_after_discount = models.PositiveIntegerField(default=0 , verbose_name="قیمت بعد از تخفیف")
+    price_after_discount = models.PositiveIntegerField(default=0 , db_index=True, verbose_name="قیمت بعد از تخفیف")
     created = models.DateTimeField(auto_now_add=True, verbose_name="تاریخ ایجاد")
     updated = models.DateTimeField(auto_now=True, verbose_name="تاریخ بروزرسانی")
     discount = models.PositiveIntegerField(verbose_name="درصد تخفیف")
-    discount_time = models.DateTimeField(verbose_name="تخفیف تا تاریخ")
+    discount_time = models.DateTimeField(db_index=True, verbose_name="تخفیف تا تاریخ")
     delivery = models.PositiveIntegerField(verbose_name="تحویل چند روزه؟")
     number_sold = models.BigIntegerField(default=0, verbose_name="تعداد فروخته شده")
-
-
-    objects = models.Manager()
+    # accepted comments, kept up to date by shop.comments
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="تعداد نظرات")
+    recommend_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="تعداد پیشنهاد دهندگان")
+    # the first uploaded image, copied here by shop.signals so listings need no extra query
+    primary_image = models.ImageField(upload_to='products/%Y/%m/%d', blank=True, editable=False, verbose_name="عکس اصلی")
+    # set when the admin edits the product, cleared by build_similar_products --stale
+    similar_stale = models.BooleanField(default=False, db_index=True, editable=False, verbose_name="نیازمند محاسبه مشابه ها")
+    # maintained by shop.search and GIN indexed on PostgreSQL only, see migration 0007
+    search_vector = SearchVectorField(null=True, editable=False)
+
+
+    objects = ProductQuerySet.as_manager()
     objects_available = AvailableManager()
     
     class Meta:
         ordering = ('-created', )
         index_together = (('id', 'slug'), ) 
+        indexes = [models.Index(fields=['available', 'discount_time'])]
         verbose_name = "محصول"
         verbose_name_plural = "محصول ها"
 
@@ -76,21 +181,31 @@ class Product(models.Model):
         return self.title   
 
 
-    def check_discount_time(self):
-        return self.discount_time > timezone.now()
+    def check_discount_time(self, now=None):
+        return self.discount_time > (now or timezone.now())
         
         
-    def get_discount(self):
-        if self.check_discount_time():
+    def get_discount(self, now=None):
+        if self.check_discount_time(now):
             return Decimal((self.discount * self.price)) / 100
         else:
             return 0
         
 
-    def get_price_after_discount(self):
-        return self.price - self.get_discount()
+    def get_price_after_discount(self, now=None):
+        return self.price - self.get_discount(now)
     
 
+    def get_image_url(self):
+        return self.primary_image.url if self.primary_image else ''
+
+
+    def get_recommend_percent(self):
+        if not self.comment_count:
+            return 0
+        return round(self.recommend_count * 100 / self.comment_count)
+
+
     def category_to_str(self):
 	    return "، ".join([category.title for category in self.category.all()])
     
@@ -105,10 +220,6 @@ class Product(models.Model):
         self.price_after_discount = self.get_price_after_discount()
         return super().save(*args, **kwargs)
     
-    def update(self, *args, **kwargs):
-        self.price_after_discount = self.get_price_after_discount()
-        return super().update(*args, **kwargs)
-    
     
 
 class Image(models.Model):
@@ -164,6 +275,35 @@ class TechnicalDescription(models.Model):
         return self.title
 
 
+class SearchPosting(models.Model):
+    token = models.CharField(max_length=100, db_index=True, verbose_name="واژه")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_postings', verbose_name="محصول مربوطه")
+    weight = models.PositiveIntegerField(default=1, verbose_name="وزن")
+
+    class Meta:
+        unique_together = ('token', 'product',)
+        verbose_name = "واژه ی جستجو"
+        verbose_name_plural = "واژه های جستجو"
+
+    def __str__(self):
+        return self.token
+
+
+class SimilarProduct(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_links', verbose_name="محصول مربوطه")
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_to', verbose_name="محصول مشابه")
+    score = models.FloatField(verbose_name="میزان شباهت")
+
+    class Meta:
+        unique_together = ('product', 'similar',)
+        indexes = [models.Index(fields=['product', '-score'])]
+        verbose_name = "محصول مشابه"
+        verbose_name_plural = "محصولات مشابه"
+
+    def __str__(self):
+        return f'{self.product} ~ {self.similar}'
+
+
 class Banner(models.Model):
     image = models.ImageField(upload_to='banners/%Y/%m/%d', verbose_name="عکس")
     link = models.URLField(verbose_name="لینک")
@@ -201,6 +341,7 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created_on', ) 
+        indexes = [models.Index(fields=['product', 'status', '-created_on'])]
         verbose_name = "نظر"
         verbose_name_plural = "نظر ها"
 
@@ -209,6 +350,23 @@ class Comment(models.Model):
 
 
 
+class WaitingManager(models.Manager):
+    def get_queryset(self):
+        return super(WaitingManager, self).get_queryset().filter(status='waiting')
+
+
+
+class WaitingComment(Comment):
+    objects = WaitingManager()
+
+    class Meta:
+        proxy = True
+        ordering = ('created_on', )
+        verbose_name = "نظر در انتظار بررسی"
+        verbose_name_plural = "صف بررسی نظرات"
+
+
+
 class Contact(models.Model):
     CHOICES = (
         ('PROPOSAL', 'پیشنهاد'),
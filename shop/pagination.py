@@ -0,0 +1,179 @@
+import base64
+import binascii
+import bisect
+import datetime
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import InvalidPage
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+PRODUCTS_PER_PAGE = 24
+
+# orderings a product listing can be browsed in; every one ends with the
+# primary key so that rows sharing a value still have a stable order
+PRODUCT_ORDERINGS = {
+    'newest': ('-created', '-id'),
+    'best_selling': ('-number_sold', '-id'),
+    # the stored price is indexed; shop.pricing keeps it in step with the
+    # discount windows
+    'cheapest': ('price_after_discount', 'id'),
+    'expensive': ('-price_after_discount', '-id'),
+}
+
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def ordering_key(ordering):
+    """
+    Return a sort key for rows of ``ordering``'s column values, so that
+    plain ascending sorting gives the rows in ``ordering``.
+    """
+    descending = [name.startswith('-') for name in ordering]
+
+    def key(row):
+        values = []
+        for value, desc in zip(row, descending):
+            if isinstance(value, datetime.datetime):
+                # whole microseconds, a float timestamp would round them
+                value = (value - EPOCH) // datetime.timedelta(microseconds=1)
+            values.append(-value if desc else value)
+        return tuple(values)
+    return key
+
+
+class CursorEncoder(json.JSONEncoder):
+    # unlike DjangoJSONEncoder keep the microseconds, the cursor has to
+    # match the stored value exactly
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage(object):
+    def __init__(self, object_list, next_cursor, cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator(object):
+    """
+    Paginate ``queryset`` by the values of its ordering columns instead of
+    by offset.
+
+    A page is read with one query for ``per_page + 1`` rows past the last
+    row of the previous page, so deep pages cost as much as the first one
+    and the total is never counted. Rows added while browsing do not shift
+    the following pages.
+    """
+
+    def __init__(self, queryset, ordering, per_page=PRODUCTS_PER_PAGE):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.per_page = per_page
+
+    def encode_cursor(self, obj):
+        return self.encode_values([getattr(obj, name) for name, descending in self.ordering])
+
+    def encode_values(self, values):
+        data = json.dumps(list(values), cls=CursorEncoder).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError):
+            raise InvalidCursor('مکان صفحه نامعتبر است.')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor('مکان صفحه نامعتبر است.')
+        return [self.to_python(name, value) for (name, descending), value in zip(self.ordering, values)]
+
+    def to_python(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # an annotation such as the search rank, stored as a plain number
+            field = None
+        try:
+            if isinstance(field, models.DateTimeField):
+                value = parse_datetime(value)
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                value = None
+        except (TypeError, ValueError):
+            value = None
+        if value is None:
+            raise InvalidCursor('مکان صفحه نامعتبر است.')
+        return value
+
+    def after(self, values):
+        """
+        Return the condition selecting rows that sort after ``values``.
+        """
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+        rows = list(queryset[:self.per_page + 1])
+        object_list = rows[:self.per_page]
+        next_cursor = self.encode_cursor(object_list[-1]) if len(rows) > self.per_page else None
+        return KeysetPage(object_list, next_cursor, cursor or None)
+
+
+class SortedRowsPaginator(KeysetPaginator):
+    """
+    Paginate a cached list of rows already sorted by ``ordering``.
+
+    Each row holds the values of the ordering columns, the primary key
+    last. The cursor is found in the list by bisection and only the ids
+    of the page are read from ``queryset``, so the database never sees
+    the whole list. Cursors are interchangeable with ``KeysetPaginator``'s.
+    """
+
+    def __init__(self, queryset, rows, ordering, per_page=PRODUCTS_PER_PAGE):
+        super().__init__(queryset, ordering, per_page)
+        self.rows = rows
+        self.key = ordering_key(ordering)
+
+    def page(self, cursor=None):
+        start = 0
+        if cursor:
+            start = bisect.bisect_right(self.rows, self.key(self.decode_cursor(cursor)), key=self.key)
+        rows = self.rows[start:start + self.per_page + 1]
+        page_rows = rows[:self.per_page]
+        # rows whose product has gone since the list was cached are skipped
+        objects = self.queryset.in_bulk([row[-1] for row in page_rows])
+        object_list = [objects[row[-1]] for row in page_rows if row[-1] in objects]
+        next_cursor = self.encode_values(page_rows[-1]) if len(rows) > self.per_page else None
+        return KeysetPage(object_list, next_cursor, cursor or None)
@@ -0,0 +1,46 @@
+import datetime
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Product, effective_price
+from .caching import bump_catalog_version
+
+
+REPRICE_BATCH_SIZE = 500
+REPRICE_LOOKBACK = datetime.timedelta(hours=24)
+
+
+def stale_prices(now, since):
+    """
+    Products whose stored price no longer matches their discount window:
+    discounts that ended after ``since`` and running discounts. Both
+    ranges use the ``discount_time`` index.
+    """
+    ended = Q(discount_time__gt=since, discount_time__lte=now)
+    running = Q(discount_time__gt=now, discount__gt=0)
+    return (Product.objects.with_effective_price(now).filter(ended | running)
+            .exclude(price_after_discount=F('effective_price')))
+
+
+def reprice_products(now=None, since=None, batch_size=REPRICE_BATCH_SIZE):
+    """
+    Recompute ``price_after_discount`` of every stale product in the
+    database, one batch of ids at a time, and invalidate the cached
+    catalog pages when any price changed. Returns the number of products
+    repriced.
+
+    Without ``since`` every expired discount is checked.
+    """
+    now = now or timezone.now()
+    since = since or datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+    candidates = stale_prices(now, since).order_by('id').values_list('id', flat=True)
+    repriced = 0
+    last_id = 0
+    while True:
+        batch = list(candidates.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1]
+        repriced += Product.objects.filter(pk__in=batch).update(price_after_discount=effective_price(now))
+    if repriced:
+        bump_catalog_version()
+    return repriced
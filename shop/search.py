@@ -0,0 +1,187 @@
+import re
+import threading
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_, add
+from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum, Max, Case, When, Value, IntegerField, FloatField, TextField, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils.html import strip_tags
+from .models import Product, Description, TechnicalDescription, SearchPosting
+
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TOKEN_LENGTH = 100
+MAX_QUERY_TERMS = 8
+
+# arabic letters, persian digits and the zero width non-joiner all have
+# common alternatives users type interchangeably
+CHARACTER_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', '\u200c': ' ',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4', '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+})
+
+# how much a token found in each field counts towards a product's rank,
+# and the matching tsvector weight class used on PostgreSQL
+FIELD_WEIGHTS = {
+    'title': 10,
+    'english_name': 8,
+    'brand': 6,
+    'technical_description': 2,
+    'description': 1,
+}
+VECTOR_WEIGHTS = {
+    'title': 'A',
+    'english_name': 'A',
+    'brand': 'B',
+    'technical_description': 'C',
+    'description': 'D',
+}
+SEARCH_CONFIG = 'simple'
+
+_pending = threading.local()
+
+
+def tokenize(text):
+    text = strip_tags(text or '').translate(CHARACTER_MAP).lower()
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(text)]
+
+
+def uses_full_text_search():
+    return connection.vendor == 'postgresql'
+
+
+def build_documents(product_ids):
+    """
+    Return the tokens of every searchable field of the given products as
+    ``{product_id: {field: [token, ...]}}``, reading each table once.
+    """
+    documents = {pk: defaultdict(list) for pk in product_ids}
+
+    def collect(product_id, field, *texts):
+        for text in texts:
+            documents[product_id][field].extend(tokenize(text))
+
+    products = Product.objects.filter(pk__in=product_ids).values_list('id', 'title', 'english_name', 'brand')
+    for pk, title, english_name, brand in products:
+        collect(pk, 'title', title)
+        collect(pk, 'english_name', english_name)
+        collect(pk, 'brand', brand)
+    for pk, title, detail in Description.objects.filter(product__in=product_ids).values_list('product', 'title', 'detail'):
+        collect(pk, 'description', title, detail)
+    for pk, title, detail in (TechnicalDescription.objects.filter(product__in=product_ids)
+                              .values_list('product', 'title', 'detail')):
+        collect(pk, 'technical_description', title, detail)
+    return documents
+
+
+def build_postings(documents):
+    """
+    Turn documents into ``{product_id: Counter(token -> weight)}``.
+    """
+    postings = {}
+    for pk, fields in documents.items():
+        postings[pk] = Counter()
+        for field, tokens in fields.items():
+            for token in tokens:
+                postings[pk][token] += FIELD_WEIGHTS[field]
+    return postings
+
+
+def build_search_vector(fields):
+    vectors = [
+        SearchVector(Value(' '.join(tokens), output_field=TextField()), weight=VECTOR_WEIGHTS[field], config=SEARCH_CONFIG)
+        for field, tokens in fields.items() if tokens
+    ]
+    return reduce(add, vectors) if vectors else None
+
+
+@transaction.atomic
+def reindex_products(product_ids):
+    """
+    Rebuild the search data of the given products: the stored search
+    vector on PostgreSQL, the token postings everywhere else.
+    """
+    product_ids = set(product_ids)
+    documents = build_documents(product_ids)
+    if uses_full_text_search():
+        for pk, fields in documents.items():
+            Product.objects.filter(pk=pk).update(search_vector=build_search_vector(fields))
+        return
+
+    postings = build_postings(documents)
+    SearchPosting.objects.filter(product__in=product_ids).delete()
+    # deleted products end up with no tokens and so with no postings
+    SearchPosting.objects.bulk_create(
+        SearchPosting(product_id=pk, token=token, weight=weight)
+        for pk, tokens in postings.items()
+        for token, weight in tokens.items()
+    )
+
+
+def _pending_ids():
+    if not hasattr(_pending, 'ids'):
+        _pending.ids = set()
+    return _pending.ids
+
+
+def schedule_reindex(product_id):
+    """
+    Reindex a product once the current transaction commits; saving a
+    product with many inline rows reindexes it only once.
+    """
+    _pending_ids().add(product_id)
+    transaction.on_commit(flush_reindex)
+
+
+def flush_reindex():
+    pending = _pending_ids()
+    if pending:
+        product_ids = set(pending)
+        pending.clear()
+        reindex_products(product_ids)
+
+
+def build_tsquery(terms):
+    """
+    Build a raw tsquery requiring every term as a prefix. Terms come from
+    ``tokenize`` and so never contain tsquery operators.
+    """
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def search_products(query, queryset=None):
+    """
+    Return available products matching every term of ``query`` as a
+    prefix of an indexed token, annotated with ``search_rank`` and
+    ordered best first.
+
+    PostgreSQL ranks the GIN indexed search vector with ``SearchRank``;
+    other databases use the token postings.
+    """
+    if queryset is None:
+        queryset = Product.objects_available.all()
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset.none().annotate(search_rank=Value(0, output_field=FloatField()))
+
+    if uses_full_text_search():
+        search_query = SearchQuery(build_tsquery(terms), search_type='raw', config=SEARCH_CONFIG)
+        return (queryset.filter(search_vector=search_query)
+                # double precision so the rank survives a round trip through a page cursor
+                .annotate(search_rank=Cast(SearchRank(F('search_vector'), search_query), FloatField()))
+                .order_by('-search_rank', '-id'))
+
+    matched_terms = reduce(add, [
+        Max(Case(When(token__startswith=term, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        for term in terms
+    ])
+    scores = (SearchPosting.objects.filter(reduce(or_, [Q(token__startswith=term) for term in terms]))
+              .values('product')
+              .annotate(score=Sum('weight'), matched_terms=matched_terms)
+              .filter(matched_terms=len(terms)))
+    rank = Subquery(scores.filter(product=OuterRef('pk')).values('score')[:1])
+    return (queryset.filter(pk__in=scores.values('product'))
+            .annotate(search_rank=rank)
+            .order_by('-search_rank', '-id'))
@@ -0,0 +1,73 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+from extensions.images import schedule_derivatives, delete_derivatives
+from .models import Product, Image, Banner, Category, Description, TechnicalDescription, Comment, WaitingComment
+from .caching import bump_catalog_version, bump_products_version, invalidate_navigation_tree
+from .search import schedule_reindex
+from .comments import refresh_comment_stats
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_indexes(sender, **kwargs):
+    bump_products_version()
+
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_navigation_cache(sender, **kwargs):
+    invalidate_navigation_tree()
+
+
+
+@receiver(post_save, sender=Product)
+def reindex_saved_product(sender, instance, **kwargs):
+    schedule_reindex(instance.pk)
+
+
+@receiver(post_save, sender=Description)
+@receiver(post_delete, sender=Description)
+@receiver(post_save, sender=TechnicalDescription)
+@receiver(post_delete, sender=TechnicalDescription)
+def reindex_described_product(sender, instance, **kwargs):
+    schedule_reindex(instance.product_id)
+
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=WaitingComment)
+@receiver(post_delete, sender=WaitingComment)
+def recount_product_comments(sender, instance, **kwargs):
+    refresh_comment_stats([instance.product_id])
+
+
+
+@receiver(post_save, sender=Image)
+def resize_uploaded_image(sender, instance, **kwargs):
+    name = instance.image.name
+    transaction.on_commit(lambda: schedule_derivatives(name))
+
+
+@receiver(post_delete, sender=Image)
+def delete_image_variants(sender, instance, **kwargs):
+    if instance.image:
+        delete_derivatives(instance.image)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def update_primary_image(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).refresh_primary_images()
@@ -0,0 +1,166 @@
+from collections import defaultdict
+import numpy as np
+from django.db import transaction
+from django.db.models import Min, Count
+from .models import Product, Property, TechnicalDescription, SimilarProduct
+from .facets import PRICE_BUCKETS
+
+
+SIMILAR_PRODUCTS_TOP_K = 12
+CHUNK_SIZE = 512
+
+# how much sharing each kind of feature makes two products alike
+FEATURE_WEIGHTS = {
+    'category': 1.0,
+    'brand': 2.0,
+    'price': 1.5,
+    'property': 1.0,
+    'technical': 0.5,
+}
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+def price_band(price):
+    for key, label, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return key
+
+
+def collect_features():
+    """
+    Return the ids of every available product and the weighted features
+    describing each of them, reading each table once.
+    """
+    features = {}
+    products = Product.objects_available.order_by('id').values_list('id', 'category_id', 'brand', 'price_after_discount')
+    for pk, category_id, brand, price in products:
+        features[pk] = {
+            ('category', category_id): FEATURE_WEIGHTS['category'],
+            ('brand', normalize(brand)): FEATURE_WEIGHTS['brand'],
+            ('price', price_band(price)): FEATURE_WEIGHTS['price'],
+        }
+    for pk, title, detail in Property.objects.filter(product__available=True).values_list('product', 'title', 'detail'):
+        features[pk][('property', normalize(title), normalize(detail))] = FEATURE_WEIGHTS['property']
+    technical = (TechnicalDescription.objects.filter(product__available=True).exclude(detail='')
+                 .values_list('product', 'title', 'detail'))
+    for pk, title, detail in technical:
+        features[pk][('technical', normalize(title), normalize(detail))] = FEATURE_WEIGHTS['technical']
+    return list(features), list(features.values())
+
+
+def build_matrix(features):
+    """
+    Vectorize the features into a dense matrix with one unit length row
+    per product, so a matrix product gives cosine similarities.
+    """
+    vocabulary = defaultdict(lambda: len(vocabulary))
+    cells = [(row, vocabulary[feature], weight) for row, product in enumerate(features) for feature, weight in product.items()]
+    matrix = np.zeros((len(features), len(vocabulary)), dtype=np.float32)
+    for row, column, weight in cells:
+        matrix[row, column] = weight
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def top_neighbours(matrix, rows, top_k):
+    """
+    Yield ``(row, [(neighbour_row, score), ...])`` with the ``top_k`` most
+    similar other rows for each of ``rows``, best first.
+    """
+    top_k = min(top_k, len(matrix) - 1)
+    if top_k <= 0:
+        return
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        scores = matrix[chunk] @ matrix.T
+        scores[np.arange(len(chunk)), chunk] = -1
+        best = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        for i, row in enumerate(chunk):
+            order = best[i][np.argsort(-scores[i, best[i]])]
+            yield row, [(column, float(scores[i, column])) for column in order if scores[i, column] > 0]
+
+
+@transaction.atomic
+def save_neighbours(product_ids, neighbours):
+    """
+    Replace the stored neighbours of ``product_ids``, or of every product
+    when it is None.
+    """
+    stored = SimilarProduct.objects.all()
+    if product_ids is not None:
+        stored = stored.filter(product__in=product_ids)
+    stored.delete()
+    SimilarProduct.objects.bulk_create(
+        SimilarProduct(product_id=product_id, similar_id=similar_id, score=score)
+        for product_id, similar in neighbours.items()
+        for similar_id, score in similar
+    )
+
+
+def build_similar_products(top_k=SIMILAR_PRODUCTS_TOP_K):
+    """
+    Recompute the nearest neighbours of every available product.
+    """
+    ids, features = collect_features()
+    matrix = build_matrix(features)
+    neighbours = {ids[row]: [(ids[column], score) for column, score in similar]
+                  for row, similar in top_neighbours(matrix, list(range(len(ids))), top_k)}
+    save_neighbours(None, neighbours)
+    return len(ids)
+
+
+def refresh_similar_products(product_ids, top_k=SIMILAR_PRODUCTS_TOP_K):
+    """
+    Recompute the neighbours of the given products and of every product
+    whose neighbours they were or have now become.
+    """
+    product_ids = set(product_ids)
+    ids, features = collect_features()
+    matrix = build_matrix(features)
+    position = {pk: row for row, pk in enumerate(ids)}
+    changed = [position[pk] for pk in product_ids if pk in position]
+
+    affected = set(product_ids)
+    affected.update(SimilarProduct.objects.filter(similar__in=product_ids).values_list('product', flat=True))
+    if changed:
+        # similarity is symmetric, so these columns score every product
+        # against the changed ones
+        scores = matrix[changed] @ matrix.T
+        # a product only has to be recomputed when a changed product now
+        # beats its weakest stored neighbour, or its list is not full yet
+        threshold = {
+            pk: lowest if count >= top_k else 0
+            for pk, lowest, count in SimilarProduct.objects.values('product')
+            .annotate(lowest=Min('score'), count=Count('id')).values_list('product', 'lowest', 'count')
+        }
+        best = scores.max(axis=0)
+        for column, pk in enumerate(ids):
+            if best[column] > threshold.get(pk, 0):
+                affected.add(pk)
+
+    rows = [position[pk] for pk in affected if pk in position]
+    neighbours = {ids[row]: [(ids[column], score) for column, score in similar]
+                  for row, similar in top_neighbours(matrix, rows, top_k)}
+    save_neighbours(affected, neighbours)
+    return affected
+
+
+def refresh_stale_similar_products(top_k=SIMILAR_PRODUCTS_TOP_K):
+    """
+    Refresh around every product marked ``similar_stale`` in one pass over
+    the catalog. Returns the products whose neighbours were recomputed.
+    """
+    stale = list(Product.objects.filter(similar_stale=True).values_list('id', flat=True))
+    if not stale:
+        return set()
+    # flags set again while this runs are kept for the next run
+    Product.objects.filter(pk__in=stale).update(similar_stale=False)
+    try:
+        return refresh_similar_products(stale, top_k)
+    except Exception:
+        Product.objects.filter(pk__in=stale).update(similar_stale=True)
+        raise
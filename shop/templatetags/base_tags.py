@@ -1,5 +1,7 @@
 from django import template
-from ..models import Category
+from django.utils.html import format_html, format_html_join
+from extensions.images import available_widths, derivative_name
+from ..caching import get_navigation_tree
 
 
 register = template.Library()
@@ -9,7 +11,7 @@ register = template.Library()
 @register.inclusion_tag("shop/category_navbar.html")
 def category_navbar():
 	return {
-		"categories": Category.objects.filter(parent=None)
+		"categories": get_navigation_tree().roots
 	}
 
 
@@ -17,3 +19,41 @@ def category_navbar():
 @register.filter
 def objects(t, product):
     return t.objects.filter(product=product)
+
+
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    """
+    The current query string with the given parameters replaced, or
+    removed when given as None.
+    """
+    params = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        params.pop(key, None)
+        if value is not None:
+            params[key] = value
+    return f'?{params.urlencode()}'
+
+
+
+@register.simple_tag
+def responsive_image(field, alt='', sizes='(max-width: 576px) 50vw, 240px', css_class=''):
+    """
+    An ``<img>`` for an uploaded image, wrapped in a ``<picture>`` with
+    webp and jpeg ``srcset`` candidates once its variants exist.
+    """
+    if not field:
+        return ''
+    widths = available_widths(field)
+    img = format_html('<img src="{}" alt="{}" class="{}"', field.url, alt, css_class)
+    if not widths:
+        return format_html('{}>', img)
+
+    def srcset(extension):
+        return format_html_join(', ', '{} {}w', (
+            (field.storage.url(derivative_name(field.name, width, extension)), width) for width in widths
+        ))
+
+    return format_html('<picture><source type="image/webp" srcset="{}" sizes="{}">{} srcset="{}" sizes="{}"></picture>',
+                       srcset('webp'), sizes, img, srcset('jpg'), sizes)
@@ -1,10 +1,35 @@
-from django.test import TestCase, Client
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from io import StringIO
+from django.test import TestCase, Client, override_settings
+from django.template import Template, Context
+from PIL import Image as PILImage
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import F
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.exceptions import ValidationError
 from django.urls import reverse
 from decimal import Decimal
 from django.utils import timezone
 from django.utils.timezone import timedelta
 from account.models import User
-from shop.models import Category, Product, Image, Property, Description, TechnicalDescription, Banner, Comment, Contact
+from shop.models import Category, Product, Image, Property, Description, TechnicalDescription, Banner, Comment, Contact, SimilarProduct
+from django.http import QueryDict
+from .search import tokenize, build_tsquery, reindex_products
+from .facets import ProductFacets, price_range_q
+from .pricing import reprice_products
+from .comments import refresh_comment_stats, COMMENTS_PER_PAGE
+from .pagination import KeysetPaginator, PRODUCT_ORDERINGS, PRODUCTS_PER_PAGE
+from .autocomplete import PrefixIndex, SUGGESTION_LIMIT
+from .caching import get_catalog_version, bump_catalog_version, HOME_PRODUCTS_KEY, get_active_offers, get_active_offer_ids, ACTIVE_OFFERS_KEY
+from .similarity import build_similar_products, refresh_similar_products
+from extensions.images import generate_derivatives, schedule_derivatives, available_widths, derivative_name
 from .forms import ContactForm, CommentForm, PostForm, ColorForm
 
 # unit test for models:
@@ -186,7 +211,886 @@ class ViewsTestCase(TestCase):
         self.assertRedirects(response, reverse('shop:contact'))  # Redirect to the same page
    
 
+class HomeCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        self.product = Product.objects.create(
+            title='Cached Phone', english_name='Cached Phone', category=self.category,
+            slug='cached-phone', brand='Brand', guarantee=1, price=1000, discount=0,
+            discount_time=timezone.now(), delivery=2
+        )
+
+    def catalog_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('shop:home'))
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in context.captured_queries if 'shop_product' in q['sql']]
+
+    def test_warm_home_page_runs_no_catalog_queries(self):
+        _, cold_queries = self.catalog_queries()
+        self.assertTrue(cold_queries)
+        response, warm_queries = self.catalog_queries()
+        self.assertEqual(warm_queries, [])
+        self.assertContains(response, 'Cached Phone')
+
+    def test_product_save_invalidates_home_page(self):
+        self.catalog_queries()
+        self.product.title = 'Renamed Phone'
+        self.product.save()
+        response, queries = self.catalog_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, 'Renamed Phone')
+        self.assertNotContains(response, 'Cached Phone')
+
+    def test_expired_home_lists_only_rebuild_the_home_fragments(self):
+        self.catalog_queries()
+        version = get_catalog_version()
+        key = HOME_PRODUCTS_KEY.format(version=version)
+        # the earliest listed discount has just ended
+        cache.set(key, dict(cache.get(key), valid_until=time.time() - 1))
+        Product.objects.filter(pk=self.product.pk).update(title='Renamed Phone')
+        response, queries = self.catalog_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, 'Renamed Phone')
+        self.assertEqual(get_catalog_version(), version)
+
+
+class CategoryTreeTestCase(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(title='Digital', slug='digital')
+        self.phones = Category.objects.create(title='Phones', slug='phones', parent=self.root)
+        self.android = Category.objects.create(title='Android', slug='android', parent=self.phones)
+
+    def create_product(self, slug, category):
+        return Product.objects.create(
+            title=slug, english_name=slug, category=category, slug=slug, brand='Brand',
+            guarantee=1, price=100, discount=0, discount_time=timezone.now(), delivery=1
+        )
+
+    def test_paths_are_materialized(self):
+        self.assertEqual(self.android.path, f'{self.root.pk}/{self.phones.pk}/{self.android.pk}/')
+        self.assertEqual(self.android.depth, 2)
+        self.assertEqual(str(self.android), 'Digital -> Phones -> Android')
+
+    def test_str_does_not_query_parents(self):
+        android = Category.objects.get(pk=self.android.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(android), 'Digital -> Phones -> Android')
+
+    def test_moving_a_node_rebuilds_descendants(self):
+        other = Category.objects.create(title='Mobile', slug='mobile')
+        self.phones.parent = other
+        self.phones.save()
+        android = Category.objects.get(pk=self.android.pk)
+        self.assertEqual(android.path, f'{other.pk}/{self.phones.pk}/{self.android.pk}/')
+        self.assertEqual(android.full_title, 'Mobile -> Phones -> Android')
+
+    def test_renaming_a_node_rebuilds_descendants(self):
+        self.root.title = 'Electronics'
+        self.root.save()
+        self.assertEqual(str(Category.objects.get(pk=self.android.pk)), 'Electronics -> Phones -> Android')
+
+    def test_parent_cannot_be_a_descendant(self):
+        self.root.parent = self.android
+        with self.assertRaises(ValidationError):
+            self.root.full_clean()
+
+    def test_ancestors(self):
+        self.assertEqual(list(self.android.get_ancestors()), [self.root, self.phones])
+
+    def test_listing_includes_products_at_any_depth(self):
+        deep = self.create_product('deep-phone', self.android)
+        shallow = self.create_product('shallow-phone', self.phones)
+        response = self.client.get(reverse('shop:product_list_by_category', args=[self.root.slug]))
+        self.assertEqual(set(response.context['products']), {deep, shallow})
+        response = self.client.get(reverse('shop:product_list_by_category', args=[self.android.slug]))
+        self.assertEqual(list(response.context['products']), [deep])
+
+
+class NavigationCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = Category.objects.create(title='Digital', slug='digital')
+        self.phones = Category.objects.create(title='Phones', slug='phones', parent=self.root)
+
+    def category_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('shop:contact'))
+        return response, [q['sql'] for q in context.captured_queries if 'shop_category' in q['sql']]
+
+    def test_navigation_is_built_once_and_shared(self):
+        response, queries = self.category_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, 'Phones')
+        _, queries = self.category_queries()
+        self.assertEqual(queries, [])
+
+    def test_category_change_invalidates_navigation(self):
+        self.category_queries()
+        Category.objects.create(title='Tablets', slug='tablets', parent=self.root)
+        response, queries = self.category_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, 'Tablets')
+
+
+class ProductDetailQueryBudgetTestCase(TestCase):
+    QUERY_BUDGET = 14
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='reader@example.com', password='testpass')
+        self.category = Category.objects.create(title='Phones', slug='phones')
+
+    def create_product(self, slug, images=1, properties=1, specs=1, comments=1):
+        product = Product.objects.create(
+            title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand',
+            guarantee=1, price=100, discount=0, discount_time=timezone.now(), delivery=1
+        )
+        for i in range(images):
+            Image.objects.create(product=product, image=f'products/{slug}-{i}.png')
+        for i in range(properties):
+            Property.objects.create(product=product, title=f'Property {i}', detail='Detail')
+        parent = None
+        for i in range(specs):
+            # every other row nests under the previous one
+            spec = TechnicalDescription.objects.create(product=product, title=f'Spec {i}', detail='Detail',
+                                                       parent=parent if i % 2 else None)
+            parent = spec
+        for i in range(comments):
+            Comment.objects.create(product=product, user=self.user, title=f'Comment {i}',
+                                   description='Text', status='accepted')
+        return product
+
+    def count_queries(self, product):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(product.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_related_rows(self):
+        small = self.create_product('small-phone')
+        self.create_product('other-phone')
+        self.client.get(small.get_absolute_url())
+        small_count = self.count_queries(small)
+
+        large = self.create_product('large-phone', images=6, properties=5, specs=8, comments=4)
+        for i in range(4):
+            self.create_product(f'similar-{i}', images=2)
+        large_count = self.count_queries(large)
+
+        self.assertEqual(small_count, large_count)
+        self.assertLessEqual(large_count, self.QUERY_BUDGET)
+
+    def test_technical_descriptions_are_assembled_into_a_tree(self):
+        product = self.create_product('spec-phone', specs=0)
+        display = TechnicalDescription.objects.create(product=product, title='Display')
+        size = TechnicalDescription.objects.create(product=product, title='Size', detail='6.1', parent=display)
+        TechnicalDescription.objects.create(product=product, title='Panel', detail='OLED', parent=size)
+        response = self.client.get(product.get_absolute_url())
+        roots = response.context['technical_descriptions']
+        self.assertEqual(roots, [display])
+        self.assertEqual(roots[0].tree_children, [size])
+        self.assertEqual(roots[0].tree_children[0].tree_children[0].detail, 'OLED')
+        self.assertContains(response, 'OLED')
+
+
+class SearchIndexTestCase(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title='Phones', slug='phones')
+
+    def create_product(self, slug, title, brand='Samsung', **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                title=title, english_name=slug, category=self.category, slug=slug, brand=brand,
+                guarantee=1, price=100, discount=0, discount_time=timezone.now(), delivery=1, **kwargs
+            )
+
+    def search(self, query):
+        response = self.client.get(reverse('shop:search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['object_list'])
+
+    def test_results_are_ranked_and_distinct(self):
+        described = self.create_product('described', 'Budget phone')
+        with self.captureOnCommitCallbacks(execute=True):
+            Description.objects.create(product=described, title='Camera', detail='<p>Galaxy class camera</p>')
+            Description.objects.create(product=described, title='Battery', detail='Better than a galaxy')
+        titled = self.create_product('titled', 'Galaxy S23')
+        self.assertEqual(self.search('galaxy'), [titled, described])
+
+    def test_every_term_must_match_as_a_prefix(self):
+        galaxy = self.create_product('galaxy', 'Galaxy A54')
+        self.create_product('iphone', 'iPhone 14', brand='Apple')
+        self.assertEqual(self.search('gal sams'), [galaxy])
+        self.assertEqual(self.search('galaxy apple'), [])
+
+    def test_persian_characters_are_normalized(self):
+        product = self.create_product('persian', 'گوشي سامسونگ')
+        self.assertEqual(self.search('گوشی'), [product])
+
+    def test_unavailable_products_are_hidden(self):
+        self.create_product('hidden', 'Galaxy Hidden', available=False)
+        self.assertEqual(self.search('galaxy'), [])
+
+    def test_spec_changes_update_the_index(self):
+        product = self.create_product('spec', 'Plain phone')
+        with self.captureOnCommitCallbacks(execute=True):
+            spec = TechnicalDescription.objects.create(product=product, title='Chip', detail='Snapdragon')
+        self.assertEqual(self.search('snapdragon'), [product])
+        with self.captureOnCommitCallbacks(execute=True):
+            spec.delete()
+        self.assertEqual(self.search('snapdragon'), [])
+
+    def test_tsquery_requires_every_term_as_prefix(self):
+        terms = tokenize('Galaxy  S23!')
+        self.assertEqual(build_tsquery(terms), 'galaxy:* & s23:*')
+
+    def test_empty_query_returns_nothing(self):
+        self.create_product('any', 'Any phone')
+        self.assertEqual(self.search(''), [])
+
+
+class AutocompleteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        self.create_product('galaxy-a54', 'Galaxy A54', number_sold=5)
+        self.create_product('galaxy-s23', 'Galaxy S23', number_sold=50)
+        self.create_product('iphone-14', 'iPhone 14', brand='Apple')
+
+    def create_product(self, slug, title, brand='Samsung', **kwargs):
+        return Product.objects.create(
+            title=title, english_name=slug, category=self.category, slug=slug, brand=brand,
+            guarantee=1, price=100, discount=0, discount_time=timezone.now(), delivery=1, **kwargs
+        )
+
+    def suggest(self, query):
+        response = self.client.get(reverse('shop:autocomplete'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.json()['results']]
+
+    def test_prefix_matches_any_word_ordered_by_sales(self):
+        self.assertEqual(self.suggest('gal'), ['Galaxy S23', 'Galaxy A54'])
+        self.assertEqual(self.suggest('s2'), ['Galaxy S23'])
+        self.assertEqual(self.suggest('appl'), ['iPhone 14'])
+        self.assertEqual(self.suggest('nokia'), [])
+
+    def test_warm_lookups_do_not_query_the_database(self):
+        self.suggest('gal')
+        with self.assertNumQueries(0):
+            self.suggest('galaxy a')
+
+    def test_index_is_rebuilt_after_product_changes(self):
+        self.suggest('gal')
+        self.create_product('galaxy-z', 'Galaxy Z Fold', number_sold=100)
+        self.assertEqual(self.suggest('gal')[0], 'Galaxy Z Fold')
+
+    def test_index_survives_unrelated_catalog_invalidation(self):
+        self.suggest('gal')
+        bump_catalog_version()
+        with self.assertNumQueries(0):
+            self.suggest('galaxy a')
+
+    def test_best_seller_is_found_among_many_matches(self):
+        products = [{'id': i, 'slug': f'phone-{i}', 'title': f'Phone {i:04}', 'english_name': f'phone-{i}',
+                     'brand': 'Brand'} for i in range(1, 700)]
+        # the best seller sorts after every other match alphabetically
+        products.insert(0, {'id': 700, 'slug': 'phone-z', 'title': 'Phone Zeta', 'english_name': 'phone-z',
+                            'brand': 'Brand'})
+        index = PrefixIndex(products)
+        for prefix in ('p', 'ph', 'phone', 'phone '):
+            self.assertEqual(index.lookup(prefix)[0]['title'], 'Phone Zeta')
+            self.assertEqual(len(index.lookup(prefix)), SUGGESTION_LIMIT)
+        self.assertEqual([s['title'] for s in index.lookup('z')], ['Phone Zeta'])
+
+
 # unit test for forms:
+class FacetsTestCase(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        self.create_product('galaxy-a', 'Samsung', 3000000, delivery=1)
+        self.create_product('galaxy-s', 'Samsung', 25000000, delivery=3, discount=10)
+        self.create_product('iphone-13', 'Apple', 30000000, delivery=1)
+        self.create_product('iphone-14', 'Apple', 45000000, delivery=3)
+
+    def create_product(self, slug, brand, price, delivery, discount=0):
+        return Product.objects.create(
+            title=slug, english_name=slug, category=self.category, slug=slug, brand=brand, guarantee=1,
+            price=price, discount=discount, discount_time=timezone.now() + timedelta(days=1), delivery=delivery
+        )
+
+    def get(self, **params):
+        response = self.client.get(reverse('shop:product_list_by_category', args=['phones']), params)
+        self.assertEqual(response.status_code, 200)
+        facets = {facet['name']: {option['value']: option['count'] for option in facet['options']}
+                  for facet in response.context['facets']}
+        return sorted(p.slug for p in response.context['products']), facets
+
+    def test_counts_without_filters(self):
+        products, facets = self.get()
+        self.assertEqual(len(products), 4)
+        self.assertEqual(facets['brand'], {'Samsung': 2, 'Apple': 2})
+        self.assertEqual(facets['price'], {'0-5': 1, '20-40': 2, '40-': 1})
+        self.assertEqual(facets['delivery'], {1: 2, 3: 2})
+        self.assertEqual(facets['discount'], {1: 1})
+
+    def test_selected_facet_keeps_its_own_options(self):
+        products, facets = self.get(brand='Apple')
+        self.assertEqual(products, ['iphone-13', 'iphone-14'])
+        # options of the selected facet are counted without its own selection
+        self.assertEqual(facets['brand'], {'Samsung': 2, 'Apple': 2})
+        self.assertEqual(facets['delivery'], {1: 1, 3: 1})
+        self.assertEqual(facets['discount'], {})
+
+    def test_filters_combine(self):
+        products, facets = self.get(price=['20-40', '40-'], delivery='3')
+        self.assertEqual(products, ['galaxy-s', 'iphone-14'])
+        self.assertEqual(facets['brand'], {'Samsung': 1, 'Apple': 1})
+        products, facets = self.get(discount='1')
+        self.assertEqual(products, ['galaxy-s'])
+
+    def test_summary_is_one_query(self):
+        facets = ProductFacets(QueryDict('brand=Apple&delivery=1&price=bad'))
+        with CaptureQueriesContext(connection) as queries:
+            facets.summary(Product.objects_available.all())
+        self.assertEqual(len(queries), 1)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        for i in range(30):
+            Product.objects.create(
+                title=f'Phone {i}', english_name=f'phone {i}', category=self.category, slug=f'phone-{i}',
+                brand='Samsung', guarantee=1, price=100, discount=0, discount_time=timezone.now(),
+                delivery=1, number_sold=i % 3
+            )
+
+    def browse(self, **params):
+        url = reverse('shop:product_list_by_category', args=['phones'])
+        seen = []
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['page']
+            seen.extend(p.slug for p in page)
+            if not page.has_next():
+                return seen
+            params['cursor'] = page.next_cursor
+
+    def test_pages_cover_every_product_once(self):
+        seen = self.browse()
+        self.assertEqual(seen, [p.slug for p in Product.objects.order_by('-created', '-id')])
+
+    def test_ties_are_broken_by_id(self):
+        seen = self.browse(sort='best_selling')
+        self.assertEqual(seen, [p.slug for p in Product.objects.order_by('-number_sold', '-id')])
+
+    def test_page_never_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('shop:product_offer_list'))
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_json_variant(self):
+        url = reverse('shop:product_list_by_category', args=['phones'])
+        data = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(data['html'].count('product-card pb-2'), 24)
+        data = self.client.get(data['next']).json()
+        self.assertEqual(data['html'].count('product-card pb-2'), 6)
+        self.assertIsNone(data['next'])
+
+    def test_invalid_cursor(self):
+        url = reverse('shop:product_list_by_category', args=['phones'])
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'cursor': 'WyJ4Il0='}).status_code, 404)
+
+    def test_search_pages(self):
+        reindex_products(Product.objects.values_list('id', flat=True))
+        response = self.client.get(reverse('shop:search'), {'q': 'phone'})
+        self.assertEqual(len(response.context['object_list']), 24)
+        response = self.client.get(reverse('shop:search'), {'q': 'phone', 'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(len(response.context['object_list']), 6)
+        self.assertFalse(response.context['page_obj'].has_next())
+
+
+class SimilarProductsTestCase(TestCase):
+    def setUp(self):
+        self.phones = Category.objects.create(title='Phones', slug='phones')
+        self.cases = Category.objects.create(title='Cases', slug='cases')
+        self.galaxy = self.create_product('galaxy-s22', 'Samsung', self.phones, 25000000, ram='8GB')
+        self.galaxy_plus = self.create_product('galaxy-s22-plus', 'Samsung', self.phones, 28000000, ram='12GB')
+        self.iphone = self.create_product('iphone-13', 'Apple', self.phones, 30000000, ram='4GB')
+        self.case = self.create_product('galaxy-case', 'Samsung', self.cases, 300000)
+
+    def create_product(self, slug, brand, category, price, ram=None, available=True):
+        product = Product.objects.create(
+            title=slug, english_name=slug, category=category, slug=slug, brand=brand, guarantee=1,
+            price=price, discount=0, discount_time=timezone.now(), delivery=1, available=available
+        )
+        if ram:
+            Property.objects.create(product=product, title='RAM', detail=ram)
+        return product
+
+    def neighbours(self, product):
+        return list(SimilarProduct.objects.filter(product=product).order_by('-score')
+                    .values_list('similar__slug', flat=True))
+
+    def test_neighbours_are_ranked_by_shared_features(self):
+        build_similar_products()
+        self.assertEqual(self.neighbours(self.galaxy), ['galaxy-s22-plus', 'galaxy-case', 'iphone-13'])
+        # products sharing nothing are never listed
+        self.assertEqual(self.neighbours(self.case), ['galaxy-s22', 'galaxy-s22-plus'])
+
+    def test_top_k_limits_neighbours(self):
+        build_similar_products(top_k=1)
+        self.assertEqual(self.neighbours(self.galaxy), ['galaxy-s22-plus'])
+        self.assertEqual(SimilarProduct.objects.count(), 4)
+
+    def test_detail_page_reads_stored_neighbours(self):
+        build_similar_products()
+        Product.objects.filter(pk=self.galaxy_plus.pk).update(available=False)
+        response = self.client.get(self.galaxy.get_absolute_url())
+        self.assertEqual([p.slug for p in response.context['similar_products']], ['galaxy-case', 'iphone-13'])
+
+    def test_refresh_adds_new_product_to_existing_lists(self):
+        build_similar_products(top_k=1)
+        twin = self.create_product('galaxy-s22-twin', 'Samsung', self.phones, 25000000, ram='8GB')
+        affected = refresh_similar_products([twin.pk], top_k=1)
+        self.assertIn(self.galaxy.pk, affected)
+        self.assertNotIn(self.case.pk, affected)
+        self.assertEqual(self.neighbours(self.galaxy), ['galaxy-s22-twin'])
+        self.assertEqual(self.neighbours(twin), ['galaxy-s22'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('build_similar_products', stdout=out)
+        self.assertIn('4 products', out.getvalue())
+        call_command('build_similar_products', '--product', str(self.case.pk), stdout=out)
+        self.assertEqual(len(self.neighbours(self.case)), 2)
+
+    def test_admin_edits_are_refreshed_by_the_stale_run(self):
+        build_similar_products(top_k=1)
+        twin = self.create_product('galaxy-s22-twin', 'Samsung', self.phones, 25000000, ram='8GB')
+        admin = User.objects.create_superuser(email='admin@example.com', password='testpass')
+        self.client.force_login(admin)
+        url = reverse('admin:shop_product_change', args=[twin.pk])
+        data = {name: getattr(twin, name) for name in ('title', 'english_name', 'slug', 'brand', 'guarantee',
+                                                        'price', 'price_after_discount', 'discount', 'delivery', 'number_sold')}
+        data.update({'category': self.phones.pk, 'available': 'on',
+                     'discount_time_0': '2030-01-01', 'discount_time_1': '00:00:00'})
+        for prefix in ('properties', 'images', 'descriptions', 'technical_descriptions', 'comments'):
+            data.update({f'{prefix}-TOTAL_FORMS': 0, f'{prefix}-INITIAL_FORMS': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Product.objects.get(pk=twin.pk).similar_stale)
+        self.assertEqual(self.neighbours(twin), [])
+
+        out = StringIO()
+        call_command('build_similar_products', '--stale', '--top-k', '1', stdout=out)
+        self.assertEqual(self.neighbours(self.galaxy), ['galaxy-s22-twin'])
+        self.assertFalse(Product.objects.filter(similar_stale=True).exists())
+        call_command('build_similar_products', '--stale', stdout=out)
+        self.assertIn('Refreshed 0 products.', out.getvalue())
+
+
+class RepricerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Phones', slug='phones')
+
+    def create_product(self, slug, discount, discount_time):
+        return Product.objects.create(
+            title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand', guarantee=1,
+            price=1000, discount=discount, discount_time=discount_time, delivery=1
+        )
+
+    def test_expired_discounts_are_repriced(self):
+        now = timezone.now()
+        expiring = self.create_product('expiring', 10, now + timedelta(hours=1))
+        self.create_product('running', 10, now + timedelta(days=1))
+        self.create_product('full-price', 0, now + timedelta(hours=1))
+        self.assertEqual(Product.objects.get(pk=expiring.pk).price_after_discount, 900)
+
+        later = now + timedelta(hours=2)
+        self.assertEqual(reprice_products(later, since=now, batch_size=1), 1)
+        prices = dict(Product.objects.values_list('slug', 'price_after_discount'))
+        self.assertEqual(prices, {'expiring': 1000, 'running': 900, 'full-price': 1000})
+        self.assertEqual(reprice_products(later, since=now), 0)
+
+    def test_started_discounts_are_repriced(self):
+        product = self.create_product('started', 10, timezone.now() + timedelta(days=1))
+        # rows written behind the model's back, e.g. by raw SQL or a fixture
+        Product.objects.filter(pk=product.pk).update(price_after_discount=1000)
+        self.assertEqual(reprice_products(), 1)
+        self.assertEqual(Product.objects.get(pk=product.pk).price_after_discount, 900)
+
+    def test_lookback_limits_expired_discounts(self):
+        now = timezone.now()
+        product = self.create_product('long-gone', 10, now + timedelta(minutes=1))
+        later = now + timedelta(days=3)
+        self.assertEqual(reprice_products(later, since=later - timedelta(hours=1)), 0)
+        self.assertEqual(reprice_products(later), 1)
+        self.assertEqual(Product.objects.get(pk=product.pk).price_after_discount, 1000)
+
+    def test_repricing_invalidates_cached_pages(self):
+        now = timezone.now()
+        self.create_product('expiring', 10, now + timedelta(minutes=1))
+        version = get_catalog_version()
+        call_command('reprice_products', stdout=StringIO())
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(reprice_products(now + timedelta(minutes=2)), 1)
+        self.assertNotEqual(get_catalog_version(), version)
+
+
+class EffectivePriceTestCase(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        now = timezone.now()
+        for slug, price, discount, discount_time in (('cheap', 500, 0, now), ('discounted', 999, 10, now + timedelta(days=1)),
+                                                     ('expired', 800, 50, now - timedelta(days=1))):
+            Product.objects.create(title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand',
+                                   guarantee=1, price=price, discount=discount, discount_time=discount_time, delivery=1)
+
+    def test_matches_the_python_price(self):
+        for product in Product.objects.with_effective_price():
+            self.assertEqual(product.effective_price, int(product.get_price_after_discount()))
+        # discounts end in the database too, before any repricing runs
+        Product.objects.filter(slug='expired').update(discount_time=timezone.now() + timedelta(days=1))
+        self.assertEqual(Product.objects.with_effective_price().get(slug='expired').effective_price, 400)
+        prices = Product.objects.with_effective_price(timezone.now() + timedelta(days=2))
+        self.assertEqual(dict(prices.values_list('slug', 'effective_price')), {'cheap': 500, 'discounted': 999, 'expired': 800})
+
+    def test_order_and_filter_in_the_database(self):
+        products = Product.objects.with_effective_price().filter(effective_price__lt=850).order_by('effective_price')
+        self.assertEqual([p.slug for p in products], ['cheap', 'expired'])
+        self.assertEqual([p.slug for p in Product.objects.with_effective_price().order_by('-effective_price')],
+                         ['discounted', 'expired', 'cheap'])
+
+    def test_queryset_update_reprices(self):
+        Product.objects.filter(slug='discounted').update(discount=20)
+        self.assertEqual(Product.objects.get(slug='discounted').price_after_discount, 799)
+        Product.objects.update(price=F('price') * 2)
+        self.assertEqual(dict(Product.objects.values_list('slug', 'price_after_discount')),
+                         {'cheap': 1000, 'discounted': 1598, 'expired': 1600})
+
+    def test_listing_sorted_by_price(self):
+        url = reverse('shop:product_list_by_category', args=['phones'])
+        response = self.client.get(url, {'sort': 'cheapest'})
+        self.assertEqual([p.slug for p in response.context['products']], ['cheap', 'expired', 'discounted'])
+        response = self.client.get(url, {'sort': 'cheapest', 'cursor': KeysetPaginator(
+            Product.objects.all(), PRODUCT_ORDERINGS['cheapest'], 1).page().next_cursor})
+        self.assertEqual([p.slug for p in response.context['products']], ['expired', 'discounted'])
+
+    def test_price_sorts_and_ranges_use_the_stored_price_index(self):
+        for ordering in (PRODUCT_ORDERINGS['cheapest'], PRODUCT_ORDERINGS['expensive']):
+            plan = Product.objects.filter(price_range_q(0, 1000)).order_by(*ordering)[:24].explain()
+            self.assertIn('USING INDEX shop_product_price_after_discount', plan)
+
+
+class ActiveOffersTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        now = timezone.now()
+        self.ending = self.create_product('ending', 10, now + timedelta(hours=1))
+        self.running = self.create_product('running', 20, now + timedelta(days=2))
+        self.create_product('no-discount', 0, now + timedelta(days=2))
+        self.create_product('ended', 30, now - timedelta(days=1))
+
+    def create_product(self, slug, discount, discount_time):
+        return Product.objects.create(
+            title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand', guarantee=1,
+            price=1000, discount=discount, discount_time=discount_time, delivery=1
+        )
+
+    def offer_slugs(self):
+        response = self.client.get(reverse('shop:product_offer_list'))
+        self.assertEqual(response.status_code, 200)
+        return [p.slug for p in response.context['products']]
+
+    def test_offers_are_cached(self):
+        self.assertEqual(get_active_offer_ids(), [self.running.id, self.ending.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_active_offer_ids(), [self.running.id, self.ending.id])
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.offer_slugs(), ['running', 'ending'])
+
+    def test_discount_change_refreshes_offers(self):
+        self.assertEqual(self.offer_slugs(), ['running', 'ending'])
+        self.running.discount = 0
+        self.running.save()
+        self.assertEqual(self.offer_slugs(), ['ending'])
+
+    def test_expired_offer_leaves_the_list(self):
+        self.assertEqual(get_active_offers()['valid_until'], self.ending.discount_time.timestamp())
+        Product.objects.filter(pk=self.ending.pk).update(discount_time=timezone.now() - timedelta(seconds=1))
+        # nothing bumped the catalog version, the cached expiry alone triggers the rebuild
+        cache.set(ACTIVE_OFFERS_KEY.format(version=get_catalog_version()),
+                  {'ids': [self.running.id, self.ending.id], 'valid_until': time.time() - 1})
+        self.assertEqual(get_active_offer_ids(), [self.running.id])
+
+    def test_home_uses_the_offer_list(self):
+        response = self.client.get(reverse('shop:home'))
+        self.assertEqual([p.slug for p in response.context['offer_product']], ['running', 'ending'])
+
+    def test_offer_pages_read_only_their_own_ids(self):
+        now = timezone.now()
+        for i in range(60):
+            product = self.create_product(f'offer-{i}', 10 + i % 7, now + timedelta(days=3))
+            Product.objects.filter(pk=product.pk).update(number_sold=i % 5)
+        url = reverse('shop:product_offer_list')
+        for sort, ordering in PRODUCT_ORDERINGS.items():
+            expected = [p.slug for p in Product.objects_available.filter(discount__gt=0, discount_time__gt=now)
+                        .order_by(*ordering)]
+            self.client.get(url, {'sort': sort})
+            seen, params, statements = [], {'sort': sort}, []
+
+            def record(execute, sql, sql_params, many, context):
+                statements.append((sql, sql_params))
+                return execute(sql, sql_params, many, context)
+
+            while True:
+                with connection.execute_wrapper(record):
+                    page = self.client.get(url, params).context['page']
+                seen.extend(p.slug for p in page)
+                if not page.has_next():
+                    break
+                params['cursor'] = page.next_cursor
+            self.assertEqual(seen, expected)
+            product_reads = [(sql, p) for sql, p in statements if 'FROM "shop_product"' in sql]
+            # one read per page, never more ids than the page shows
+            self.assertEqual(len(product_reads), 3)
+            self.assertTrue(all(len(p) <= PRODUCTS_PER_PAGE for sql, p in product_reads))
+
+
+class CommentStatsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='reader@example.com', password='testpass')
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        self.product = Product.objects.create(
+            title='Phone', english_name='Phone', category=self.category, slug='phone', brand='Brand',
+            guarantee=1, price=100, discount=0, discount_time=timezone.now(), delivery=1
+        )
+
+    def comment(self, status='accepted', offer_vote=False, title='Comment'):
+        return Comment.objects.create(product=self.product, user=self.user, title=title,
+                                      description='Text', status=status, offer_vote=offer_vote)
+
+    def stats(self):
+        self.product.refresh_from_db()
+        return self.product.comment_count, self.product.recommend_count
+
+    def test_counters_follow_status_changes(self):
+        waiting = self.comment(status='waiting', offer_vote=True)
+        self.comment(offer_vote=True)
+        self.comment()
+        self.assertEqual(self.stats(), (2, 1))
+        waiting.status = 'accepted'
+        waiting.save()
+        self.assertEqual(self.stats(), (3, 2))
+        self.assertEqual(self.product.get_recommend_percent(), 67)
+        waiting.delete()
+        self.assertEqual(self.stats(), (2, 1))
+
+    def test_refresh_repairs_counters(self):
+        self.comment(offer_vote=True)
+        Product.objects.update(comment_count=0, recommend_count=0)
+        self.assertEqual(refresh_comment_stats([self.product.pk]), 1)
+        self.assertEqual(self.stats(), (1, 1))
+
+    def test_detail_page_shows_first_page_only(self):
+        for i in range(COMMENTS_PER_PAGE + 3):
+            self.comment(title=f'Comment {i}')
+        response = self.client.get(self.product.get_absolute_url())
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertContains(response, f'نظرات کاربران ({COMMENTS_PER_PAGE + 3})')
+
+        url = reverse('shop:product_comments', args=[self.product.id])
+        data = self.client.get(url, {'cursor': comments.next_cursor}).json()
+        self.assertEqual(data['html'].count('comments-user-shopping'), 3)
+        self.assertIn('Comment 0', data['html'])
+        self.assertIsNone(data['next'])
+        self.assertEqual(self.client.get(url, {'cursor': 'broken'}).status_code, 404)
+
+
+class CommentModerationAdminTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='adminpassword')
+        self.client.force_login(self.admin)
+        self.category = Category.objects.create(title='Phones', slug='phones')
+        self.products = [
+            Product.objects.create(title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand',
+                                   guarantee=1, price=100, discount=0, discount_time=timezone.now(), delivery=1)
+            for slug in ('first', 'second')
+        ]
+        self.comments = [
+            Comment.objects.create(product=product, user=self.admin, title=f'Comment {i}', description='Text',
+                                   offer_vote=bool(i % 2))
+            for i, product in enumerate(self.products * 2)
+        ]
+
+    def act(self, url_name, action, comments):
+        return self.client.post(reverse(url_name), {
+            'action': action, '_selected_action': [c.pk for c in comments],
+        }, follow=True)
+
+    def test_queue_lists_waiting_comments_only(self):
+        Comment.objects.filter(pk=self.comments[0].pk).update(status='accepted')
+        response = self.client.get(reverse('admin:shop_waitingcomment_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+
+    def test_accept_in_bulk_updates_product_stats(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.act('admin:shop_waitingcomment_changelist', 'accept_comments', self.comments[:3])
+        self.assertEqual(response.status_code, 200)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "shop_comment"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Comment.accepted.count(), 3)
+        first, second = [Product.objects.get(pk=p.pk) for p in self.products]
+        self.assertEqual((first.comment_count, first.recommend_count), (2, 0))
+        self.assertEqual((second.comment_count, second.recommend_count), (1, 1))
+
+        self.act('admin:shop_comment_changelist', 'reject_comments', self.comments[1:2])
+        second.refresh_from_db()
+        self.assertEqual(second.comment_count, 0)
+        self.assertEqual(Comment.objects.filter(status='not accepted').count(), 1)
+
+    def test_changelist_has_no_product_or_user_filters(self):
+        response = self.client.get(reverse('admin:shop_comment_changelist'))
+        self.assertEqual(response.status_code, 200)
+        filters = [spec.title for spec in response.context['cl'].filter_specs]
+        self.assertNotIn(Comment._meta.get_field('product').verbose_name, filters)
+        self.assertNotIn(Comment._meta.get_field('user').verbose_name, filters)
+
+
+class PrimaryImageTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(title='Phones', slug='phones')
+
+    def create_product(self, slug, images=1):
+        product = Product.objects.create(
+            title=slug, english_name=slug, category=self.category, slug=slug, brand='Brand',
+            guarantee=1, price=100, discount=0, discount_time=timezone.now(), delivery=1
+        )
+        for i in range(images):
+            Image.objects.create(product=product, image=f'products/{slug}-{i}.png')
+        return product
+
+    def test_primary_image_follows_the_first_image(self):
+        product = self.create_product('phone', images=0)
+        self.assertEqual(product.get_image_url(), '')
+        first = Image.objects.create(product=product, image='products/front.png')
+        Image.objects.create(product=product, image='products/back.png')
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name, 'products/front.png')
+        self.assertEqual(product.get_image_url(), '/media/products/front.png')
+
+        first.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name, 'products/back.png')
+        product.images.get().delete()
+        product.refresh_from_db()
+        self.assertEqual(product.primary_image.name, '')
+
+    def count_listing_queries(self):
+        url = reverse('shop:product_list_by_category', args=[self.category.slug])
+        # the first request also fills the navigation cache
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_listing_queries_do_not_grow_with_products(self):
+        for i in range(2):
+            self.create_product(f'phone-{i}', images=2)
+        few = self.count_listing_queries()
+        for i in range(2, 12):
+            self.create_product(f'phone-{i}', images=2)
+        self.assertEqual(self.count_listing_queries(), few)
+        self.assertContains(self.client.get(reverse('shop:product_list_by_category', args=[self.category.slug])),
+                            'products/phone-11-0.png')
+
+
+class ImageDerivativesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(self.media.name, 'products'))
+
+    def make_image(self, name, width, height=400):
+        path = os.path.join(self.media.name, 'products', name)
+        PILImage.new('RGB', (width, height), (200, 30, 30)).save(path)
+        return path
+
+    def test_generate_derivatives_never_upscales(self):
+        path = self.make_image('phone.png', 700)
+        created = generate_derivatives(path)
+        self.assertEqual(sorted(created), sorted(derivative_name(path, width, extension)
+                                                 for width in (320, 640) for extension in ('webp', 'jpg')))
+        with PILImage.open(derivative_name(path, 320, 'jpg')) as variant:
+            self.assertEqual(variant.size, (320, 183))
+        self.assertFalse(os.path.exists(derivative_name(path, 1024, 'webp')))
+
+    def test_generate_derivatives_skips_unreadable_files(self):
+        path = os.path.join(self.media.name, 'products', 'broken.jpg')
+        with open(path, 'w') as broken:
+            broken.write('not an image')
+        self.assertEqual(generate_derivatives(path), [])
+
+    def test_responsive_image_tag(self):
+        template = Template('{% load base_tags %}{% responsive_image image.image "phone" %}')
+        image = Image(image='products/phone.png')
+        self.make_image('phone.png', 700)
+        self.assertHTMLEqual(template.render(Context({'image': image})),
+                             '<img src="/media/products/phone.png" alt="phone" class="">')
+
+        recorded = threading.Event()
+        # callbacks run in the order they were added, after the one recording the widths
+        schedule_derivatives(image.image.name).add_done_callback(lambda future: recorded.set())
+        self.assertTrue(recorded.wait(10))
+        # the widths were recorded with the variants, so rendering never asks the storage
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError):
+            html = template.render(Context({'image': image}))
+        self.assertIn('<source type="image/webp" srcset="/media/products/phone.320w.webp 320w, '
+                      '/media/products/phone.640w.webp 640w"', html)
+        self.assertIn('srcset="/media/products/phone.320w.jpg 320w, /media/products/phone.640w.jpg 640w"', html)
+        self.assertEqual(template.render(Context({'image': None})), '')
+
+    def test_backfill_command(self):
+        self.make_image('a.png', 1200)
+        self.make_image('b.jpg', 500)
+        out = StringIO()
+        call_command('build_image_derivatives', workers=2, stdout=out)
+        self.assertIn('Wrote 8 image variants.', out.getvalue())
+        # variants already written are not treated as originals on a second run
+        call_command('build_image_derivatives', workers=2, stdout=out)
+        self.assertEqual(len(os.listdir(os.path.join(self.media.name, 'products'))), 2 + 8)
+        self.assertEqual(available_widths(Image(image='products/a.png').image), [320, 640, 1024])
+        self.assertEqual(available_widths(Image(image='products/b.jpg').image), [320])
+
+    def test_backfill_skips_oversized_files(self):
+        self.make_image('a.png', 400, 100)
+        self.make_image('bomb.png', 2000, 1000)
+        self.make_image('z.png', 400, 100)
+        # the pool is forked with the lowered limit in place
+        with mock.patch.object(PILImage, 'MAX_IMAGE_PIXELS', 60000):
+            self.assertEqual(generate_derivatives(os.path.join(self.media.name, 'products', 'bomb.png')), [])
+            out = StringIO()
+            call_command('build_image_derivatives', workers=2, stdout=out)
+        self.assertIn('Wrote 4 image variants.', out.getvalue())
+        self.assertEqual(available_widths(Image(image='products/z.png').image), [320])
+
+
 class FormsTestCase(TestCase):
     def test_contact_form_valid(self):
         form_data = {
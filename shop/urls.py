@@ -7,6 +7,8 @@ app_name = 'shop'
 urlpatterns = [
     path('', views.Home.as_view(), name='home'),
     path('search/', views.SearchList.as_view(), name="search"),
+    path('search/autocomplete/', views.autocomplete, name="autocomplete"),
+    path('<int:id>/comments/', views.product_comments, name='product_comments'),
     path('<int:id>/<slug:slug>/', views.ProductDetailView.as_view(), name='product_detail'),
     path('category/<slug:slug>/', views.ProductListByCategory.as_view(), name='product_list_by_category'), 
     path('product_offer_list/', views.product_offer_list, name='product_offer_list'), 
@@ -1,26 +1,67 @@
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django.views import View
 from django.views.generic import ListView, DetailView, FormView, CreateView, View
-from .models import Product, Banner, Category, Comment, Contact, TechnicalDescription
-from django.db.models import Q
+from .models import Product, Banner, Category, Comment, Contact
 from .forms import CommentForm, ContactForm
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse, Http404
+from django.template.loader import render_to_string
 from django.views.generic.detail import SingleObjectMixin
 from django.contrib import messages
 from django.urls import reverse
-from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.conf import settings
+from .caching import get_home_product_ids, get_active_offers
+from .search import search_products
+from .facets import ProductFacets
+from .comments import comment_page
+from .pagination import KeysetPaginator, SortedRowsPaginator, InvalidCursor, PRODUCT_ORDERINGS, PRODUCTS_PER_PAGE
+from .autocomplete import get_prefix_index
+from .loaders import product_detail_queryset, similar_products, build_technical_tree
+from order.recommendations import bought_together
+
+
+def paginate_products(request, queryset, ordering, per_page=PRODUCTS_PER_PAGE):
+    try:
+        return KeysetPaginator(queryset, ordering, per_page).page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404
+
+
+def listing_ordering(request):
+    return PRODUCT_ORDERINGS.get(request.GET.get('sort'), PRODUCT_ORDERINGS['newest'])
+
+
+def product_page_response(request, page):
+    """
+    The next page of a listing as rendered cards, for infinite scrolling.
+    """
+    next_url = None
+    if page.has_next():
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    html = ''.join(render_to_string('shop/product_card.html', {'product': product}, request) for product in page)
+    return JsonResponse({'html': html, 'next': next_url})
+
 
 
 class Home(View):
     def get(self, request):
-        last_products = Product.objects_available.all()[:20]
-        best_sellers_products = Product.objects_available.order_by('-number_sold')[:9] 
-        offer_products = Product.objects_available.filter(~Q(discount=0), discount_time__gte=timezone.now())[:10]
-        
+        fragment_version, ids = get_home_product_ids()
+        # products are only fetched, in a single query, when a fragment
+        # has to be rendered again; a warm page never touches the catalog
+        products = SimpleLazyObject(lambda: Product.objects.in_bulk(
+            ids['last_products'] + ids['best_sellers_products'] + ids['offer_product']))
+
+        def lazy_list(name):
+            return SimpleLazyObject(lambda: [products[i] for i in ids[name] if i in products])
+
         return render(request, 'shop/home.html', 
-                {'last_products': last_products, 
-                'best_sellers_products': best_sellers_products,
-                'offer_product': offer_products, 
+                {'last_products': lazy_list('last_products'), 
+                'best_sellers_products': lazy_list('best_sellers_products'),
+                'offer_product': lazy_list('offer_product'), 
+                'fragment_version': fragment_version,
+                'cache_timeout': settings.SHOP_CACHE_TIMEOUT,
         })
         
 
@@ -42,13 +83,17 @@ class ProductDisplay(DetailView):
     template_name = 'shop/product_detail.html'
     context_object_name = 'product'
 
+    def get_queryset(self):
+        return product_detail_queryset()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        product = self.object
         context['form'] = CommentForm()
-        context['technical_descriptions'] = context['product'].technical_descriptions.filter(parent=None)
-        context['technical_descriptions'] = TechnicalDescription.objects.filter(product=context['product'], parent=None)
-        context['similar_products'] = Product.objects.filter(category=context['product'].category)
-        context['comments'] = Comment.accepted.filter(product=self.get_object())
+        context['technical_descriptions'] = build_technical_tree(product.technical_descriptions.all())
+        context['similar_products'] = similar_products(product)
+        context['bought_together'] = bought_together(product)
+        context['comments'] = comment_page(product.id)
         return context
 
 
@@ -89,36 +134,82 @@ class ProductComment(SingleObjectMixin, FormView):
 
 
 class SearchList(ListView):
-	paginate_by = 200
+	paginate_by = PRODUCTS_PER_PAGE
 	template_name = 'shop/search_list.html'
 
 	def get_queryset(self):
-		search = self.request.GET.get('q')
-		return Product.objects_available.filter(Q(descriptions__detail__icontains=search) | Q(title__icontains=search) | Q(technical_descriptions__detail__icontains=search))
+		self.facets = ProductFacets(self.request.GET)
+		self.results = search_products(self.request.GET.get('q', ''))
+		return self.facets.filter(self.results)
 
 	def get_context_data(self, **kwargs):
 		context = super().get_context_data(**kwargs)
 		context['search'] = self.request.GET.get('q')
+		context['facets'] = self.facets.summary(self.results)
 		return context
 
+	def paginate_queryset(self, queryset, page_size):
+		page = paginate_products(self.request, queryset, ('-search_rank', '-id'), page_size)
+		return None, page, page.object_list, page.has_other_pages()
+
+	def render_to_response(self, context, **response_kwargs):
+		if self.request.GET.get('format') == 'json':
+			return product_page_response(self.request, context['page_obj'])
+		return super().render_to_response(context, **response_kwargs)
+
+
+
+def product_comments(request, id):
+    """
+    The next page of a product's comments, for the "more comments" button.
+    """
+    try:
+        page = comment_page(id, request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404
+    next_url = None
+    if page.has_next():
+        next_url = f"{request.path}?cursor={page.next_cursor}"
+    html = ''.join(render_to_string('shop/comment.html', {'comment': comment}, request) for comment in page)
+    return JsonResponse({'html': html, 'next': next_url})
+
+
+
+def autocomplete(request):
+    suggestions = get_prefix_index().lookup(request.GET.get('q', ''))
+    return JsonResponse({'results': suggestions})
+
 
 
 class ProductListByCategory(View):
     def get(self, request, *args, **kwargs):
-        category_slug = self.kwargs.get('slug')
-        category = Category.objects.get(slug=category_slug)
-        if category.parent is None:
-            products = Product.objects_available.filter(category__parent__slug=category_slug)
-        else:
-            products = category.products.filter(available=True)
+        category = get_object_or_404(Category, slug=self.kwargs.get('slug'))
+        # every product under this node at any depth, via the indexed path prefix
+        products = Product.objects_available.filter(category__path__startswith=category.path)
+        facets = ProductFacets(request.GET)
+        page = paginate_products(request, facets.filter(products), listing_ordering(request))
+        if request.GET.get('format') == 'json':
+            return product_page_response(request, page)
 
-        return render(request, template_name='shop/product_list_by_category.html', context={'products': products, 'category': category})
+        return render(request, template_name='shop/product_list_by_category.html', 
+                      context={'products': page, 'page': page, 'category': category, 
+                               'ancestors': category.get_ancestors(), 'facets': facets.summary(products)})
 
 
 
 def product_offer_list(request):
-    products = Product.objects_available.filter(~Q(discount=0), discount_time__gte=timezone.now())
-    return render(request, 'shop/product_offer_list.html', {'products': products})
+    sort = request.GET.get('sort')
+    if sort not in PRODUCT_ORDERINGS:
+        sort = 'newest'
+    # the cached list is cut at the cursor here, only the page is read
+    paginator = SortedRowsPaginator(Product.objects_available, get_active_offers()['rows'][sort], PRODUCT_ORDERINGS[sort])
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404
+    if request.GET.get('format') == 'json':
+        return product_page_response(request, page)
+    return render(request, 'shop/product_offer_list.html', {'products': page, 'page': page})
 
 
 
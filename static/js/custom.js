@@ -0,0 +1,112 @@
+// search-as-you-type suggestions for the header search boxes
+$(function () {
+    $('input[data-autocomplete-url]').each(function () {
+        var input = $(this);
+        var box = input.closest('.search-box').find('.search-result');
+        var list = box.find('.search-result-list');
+        var timer = null;
+
+        input.on('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                var query = $.trim(input.val());
+                if (!query) {
+                    box.hide();
+                    return;
+                }
+                $.getJSON(input.data('autocomplete-url'), {q: query}, function (data) {
+                    list.empty();
+                    $.each(data.results, function (i, item) {
+                        list.append($('<li>').append($('<a>').attr('href', item.url).text(item.title)));
+                    });
+                    box.toggle(data.results.length > 0);
+                });
+            }, 150);
+        });
+
+        input.on('blur', function () {
+            setTimeout(function () { box.hide(); }, 200);
+        });
+    });
+});
+
+// infinite scrolling for paginated listings and comments: the next page
+// is appended when a "load more" button comes into view or is clicked
+$(function () {
+    $('.load-more').each(function () {
+        var button = $(this);
+        var list = $(button.data('target') || '.listing-items').last();
+        var loading = false;
+
+        function loadMore() {
+            var url = button.data('next-url');
+            if (loading || !url) {
+                return;
+            }
+            loading = true;
+            $.getJSON(url, function (data) {
+                list.append(data.html);
+                if (data.next) {
+                    button.data('next-url', data.next);
+                } else {
+                    button.remove();
+                }
+            }).always(function () {
+                loading = false;
+            });
+        }
+
+        button.on('click', function (event) {
+            event.preventDefault();
+            loadMore();
+        });
+        $(window).on('scroll', function () {
+            if (button.is(':visible') && $(window).scrollTop() + $(window).height() > button.offset().top - 200) {
+                loadMore();
+            }
+        });
+    });
+});
+
+// cart quantity buttons: the change is posted to the cart API and only the
+// affected line and the totals are updated; links still work without js
+$(function () {
+    function csrfToken() {
+        var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    function price(value) {
+        return value.toLocaleString('en-US');
+    }
+
+    $(document).on('click', '[data-cart-action]', function (event) {
+        var link = $(this);
+        event.preventDefault();
+        $.ajax({
+            url: link.data('cart-action'),
+            type: 'POST',
+            headers: {'X-CSRFToken': csrfToken()}
+        }).done(function (data) {
+            $('[data-cart-count]').text(data.count);
+            $('[data-cart-total]').each(function () {
+                $(this).text(price(data[$(this).data('cart-total')]));
+            });
+            if (data.line) {
+                $('[data-cart-quantity="' + data.product + '"]').each(function () {
+                    $(this).is('input') ? $(this).val(data.line.quantity) : $(this).text(data.line.quantity);
+                });
+                $('[data-cart-line-total="' + data.product + '"]').text(price(data.line.total_price));
+            } else {
+                $('[data-cart-line="' + data.product + '"]').remove();
+                $('input[data-cart-quantity="' + data.product + '"]').val(0);
+            }
+        }).fail(function (xhr) {
+            if (xhr.status === 401) {
+                window.location = xhr.responseJSON.login_url + '?next=' + encodeURIComponent(window.location.pathname);
+            } else {
+                window.location = link.attr('href');
+            }
+        });
+    });
+});